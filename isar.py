@@ -3,15 +3,8 @@ import platform
 import sys
 import time
 
-from PyQt5 import QtWidgets
-
 import isar
 from isar import ApplicationMode
-from isar.domainlearning.domainlearning import DomainLearningWindow
-from isar.handskilllearning.handskill_exercise_definition import HandSkillExerciseDefinition
-from isar.handskilllearning.handskill_exercise_execution import HandSkillExerciseExecution
-from isar.scene.definitionwindow import SceneDefinitionWindow
-from isar.services import servicemanager
 
 
 def configure_logging():
@@ -39,6 +32,15 @@ def main():
     # See: https://stackoverflow.com/questions/50168647/multiprocessing-causes-python-to-crash-and-gives-an-error-may-have-been-in-progr
     # os.environ["OBJC_DISABLE_INITIALIZE_FORK_SAFETY"] = "YES"
 
+    # The UI is imported here and not at the top of the module: the pose estimation pool processes import this
+    # module as __mp_main__, and they do not need PyQt5.
+    from PyQt5 import QtWidgets
+    from isar.domainlearning.domainlearning import DomainLearningWindow
+    from isar.handskilllearning.handskill_exercise_definition import HandSkillExerciseDefinition
+    from isar.handskilllearning.handskill_exercise_execution import HandSkillExerciseExecution
+    from isar.scene.definitionwindow import SceneDefinitionWindow
+    from isar.services import servicemanager
+
     isar.PLATFORM = platform.system()
 
     use_cases = ["1", "2", "3", "4"]
@@ -17,6 +17,46 @@ POISON_PILL = "poison_pill"
 CAMERA_UPDATE_INTERVAL = 50     # it is QTimer timeout interval in ms
 OBJECT_DETECTION_INTERVAL = 0.1    # it is QTimer timeout interval in ms
 SELECTION_STICK_TRACKING_INTERVAL = 0.05   # it is time.sleep() in sec
+OBJECT_DETECTION_DEADLINE = 1.0     # max time in sec to wait for the object detectors to respond to a frame
+OBJECT_DETECTION_BATCH_SIZE = 4     # max number of pending requests an object detector runs as one batch
+# Send new frames to the busy object detectors too (up to OBJECT_DETECTION_BATCH_SIZE frames each), so that they run
+# them as a batch. It is for the throughput of replays, with a live camera it only adds latency.
+OBJECT_DETECTION_THROUGHPUT_MODE = False
+# An object detector process is restarted if it dies, does not warm up within the warm up timeout, does not respond
+# to a request within the request timeout, or does not send a heartbeat within the heartbeat timeout (a detection
+# that takes longer counts as hanging). The restarts of a detector are delayed with an
+# exponential backoff from OBJECT_DETECTION_RESTART_BACKOFF_MIN to OBJECT_DETECTION_RESTART_BACKOFF_MAX sec.
+OBJECT_DETECTION_WARM_UP_TIMEOUT = 120.0
+OBJECT_DETECTION_REQUEST_TIMEOUT = 10.0
+OBJECT_DETECTION_HEARTBEAT_TIMEOUT = 5.0
+OBJECT_DETECTION_RESTART_BACKOFF_MIN = 1.0
+OBJECT_DETECTION_RESTART_BACKOFF_MAX = 60.0
+# Keep a warmed-up standby process for each object detector to replace a failed one without loading the model
+OBJECT_DETECTION_STANDBY_WORKERS = False
+# Reuse the last predictions while the scene does not change and detect only the changed region of the scene
+OBJECT_DETECTION_MOTION_GATING = True
+OBJECT_DETECTION_REFRESH_INTERVAL = 2.0     # max time in sec between two detections of the whole scene
+# Move the boxes of the last predictions with optical flow in the camera frames between two detections
+OBJECT_BOX_TRACKING = True
+# max time in sec to wait for the pose estimation of a prediction, after it the previous pose is used
+POSE_ESTIMATION_DEADLINE = 0.5
+POSE_ESTIMATION_PROCESSES = None   # size of the pose estimation pool shared by the object detectors, None = CPU cores
+CAMERA_FRAME_TIMEOUT = 1.0     # it is the max time in sec a blocking consumer waits for a new camera frame
+
+# A video file or a directory of frame images to replay instead of capturing from the camera (None = live camera)
+CAMERA_REPLAY_PATH = None
+CAMERA_REPLAY_REALTIME = True   # replay at the recorded timestamps (True) or as fast as possible (False)
+
+# Grab the raw MJPEG buffer of the camera and decode it only as far as each consumer needs it (Linux only)
+CAMERA_LAZY_MJPEG_DECODE = False
+
+# The intrinsic camera calibration with the undistortion lookup tables (see isar.camera.undistortion)
+CAMERA_CALIBRATION_PATH = "camera_calibration.npz"
+# Calibrate the camera at startup and save it to CAMERA_CALIBRATION_PATH (set it to True once, with a chessboard at hand)
+CAMERA_CALIBRATE_INTRINSICS = False
+
+# Record the camera frames to this video file for replaying them later with CAMERA_REPLAY_PATH (None = no recording)
+CAMERA_RECORDING_PATH = None
 
 
 
@@ -1,37 +1,70 @@
 import logging
 import platform
+import queue
 import threading
-from queue import LifoQueue
+import time
+
 import cv2
 
 import isar
+from isar.camera.recorder import FrameRecorder
+from isar.camera.replay import ReplayCapture
+from isar.camera.undistortion import Undistorter, calibrate_camera, find_chessboard_corners, \
+    CHESSBOARD_PATTERN_SIZE, MIN_CALIBRATION_IMAGES
 from isar.services.service import Service
 
 logger = logging.getLogger("isar.camera")
 
+CAPTURE_EVENT_TIMEOUT = 0.5  # sec, how often the idle capture thread checks the stop event
+
 
 class CameraService(Service):
     """
-    Starts the OpenCV capturing and puts the frame in order in the FIFO queue
+    Starts the OpenCV capturing and puts the frames in a ring buffer.
+    The most recent frame is always available in the "latest frame" slot of the buffer.
     """
 
-    def __init__(self, service_name=None, cam_id=0):
+    def __init__(self, service_name=None, cam_id=0, replay_path=None, replay_realtime=True,
+                 lazy_mjpeg_decode=False, calibration_path=None):
+        """
+        :param replay_path: a video file or a directory of frame images. If it is given,
+        the frames are replayed from it instead of being captured from the camera cam_id.
+        :param replay_realtime: replay the frames at their recorded timestamps, or as fast as possible
+        :param lazy_mjpeg_decode: grab the raw MJPEG buffer of the camera (Linux only) instead of the decoded image.
+        The frames are then decoded by the consumers, at full resolution only if they need it.
+        :param calibration_path: the camera calibration file (see isar.camera.undistortion).
+        If it exists, the lens distortion is removed from all frames.
+        """
         super().__init__(service_name)
 
-        _queue_size = 20
-        self._queue = LifoQueue(_queue_size)
-
-        # self._queue_size = 20
-        # self._queue = Queue(self._queue_size)
+        _buffer_size = 4
+        self._frame_buffer = FrameRingBuffer(_buffer_size)
 
         self.cam_id = cam_id
+        self.replay_path = replay_path
+        self.replay_realtime = replay_realtime
+        self.lazy_mjpeg_decode = lazy_mjpeg_decode
+        self.calibration_path = calibration_path
+        self._undistorter = Undistorter.load(calibration_path)
+        # the latest distorted frame for the intrinsic calibration while it runs, None otherwise
+        self._calibration_frames = None
         self._capture = None
         self._open_capture()
         self._stop_event = threading.Event()
-        self._do_capture = False
+        self._capture_event = threading.Event()
+
+        self._subscriptions = []
+        self._subscriptions_lock = threading.Lock()
+
+        self._recorder = None
+        self._scene_rect = None
 
     def _open_capture(self):
-        if isar.PLATFORM == "Windows":
+        if self.replay_path is not None:
+            self._capture = ReplayCapture(self.replay_path, realtime=self.replay_realtime)
+            logger.info("Replaying frames from {}".format(self.replay_path))
+
+        elif isar.PLATFORM == "Windows":
             self._capture = cv2.VideoCapture(self.cam_id, cv2.CAP_DSHOW)
             width = 1920
             height = 1080
@@ -45,6 +78,9 @@ class CameraService(Service):
             height = 1080
             self._capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
             self._capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            if self.lazy_mjpeg_decode:
+                # read() returns the MJPEG buffer as it comes from the camera
+                self._capture.set(cv2.CAP_PROP_CONVERT_RGB, 0)
 
         else:  # Darwin
             self._capture = cv2.VideoCapture(self.cam_id)
@@ -57,7 +93,10 @@ class CameraService(Service):
             # self.capture.set(cv2.CAP_PROP_FPS, 24)
 
         if not self._capture.isOpened():
-            message = "Could not open camera {}".format(self.cam_id)
+            if self.replay_path is not None:
+                message = "Could not open replay {}".format(self.replay_path)
+            else:
+                message = "Could not open camera {}".format(self.cam_id)
             raise Exception(message)
 
     def start(self):
@@ -67,49 +106,65 @@ class CameraService(Service):
 
     def _start_capture(self):
         """
-        Read OpenCV frames and put them in the Queue.
-        It blocks if the queue is full.
+        Read OpenCV frames and put them in the ring buffer.
+        The thread sleeps on the capture event while capturing is off, and blocks
+        on the device (capture.read()) until the next frame is ready otherwise.
         """
         if not self._capture.isOpened():
             self._open_capture()
 
+        frame_size = self.get_camera_capture_size()
         frame_number = -1
         while not self._stop_event.is_set():
-            if not self._do_capture:
-                continue
-
-            if self._queue.full():
-                # logger.warning("Camera _queue is full! continue.")
+            if not self._capture_event.wait(timeout=CAPTURE_EVENT_TIMEOUT):
                 continue
 
-            # time.sleep(0.05)
-
             ret, frame = self._capture.read()
             if ret:
                 frame_number += 1
-                camera_frame = CameraFrame(frame, frame_number)
-                self._queue.put(camera_frame)
+                is_encoded = self.lazy_mjpeg_decode and (frame.ndim == 1 or frame.shape[0] == 1)
+                # the recordings are undistorted already
+                undistorter = self._undistorter if self.replay_path is None else None
+                calibration_frames = self._calibration_frames
+                distorted_frame = None
+                if is_encoded and undistorter is None:
+                    camera_frame = CameraFrame(None, frame_number, time.time(),
+                                               encoded_image=frame.reshape(-1), size=frame_size)
+                else:
+                    # undistortion needs the decoded image
+                    if is_encoded:
+                        frame = cv2.imdecode(frame.reshape(-1), cv2.IMREAD_COLOR)
+                    if undistorter is not None:
+                        if calibration_frames is not None:
+                            # remap() returns a new image, the distorted one is kept for the calibration
+                            distorted_frame = CameraFrame(frame, frame_number, time.time())
+                        frame = undistorter.undistort(frame)
+                    camera_frame = CameraFrame(frame, frame_number, time.time())
+                camera_frame.scene_rect = self._scene_rect
+                if calibration_frames is not None:
+                    self._put_calibration_frame(calibration_frames,
+                                                distorted_frame if distorted_frame is not None else camera_frame)
+                # the service may have been stopped while the thread was blocked in read()
+                if self._stop_event.is_set():
+                    break
+                self._frame_buffer.put(camera_frame)
+
+                recorder = self._recorder
+                if recorder is not None:
+                    recorder.add_frame(camera_frame)
             else:
                 logger.error("Capture was unsuccessful.")
 
     def stop(self):
         """
         Stop capturing
+        Consumers waiting for a frame are woken up with a POISON_PILL.
         :return:
         """
         self._stop_event.set()
-
-        for i in range(100):
-            try:
-                self._queue.get_nowait()
-            except:
-                pass
-
-        for i in range(100):
-            try:
-                self._queue.put_nowait(isar.POISON_PILL)
-            except:
-                pass
+        self._frame_buffer.clear()
+        self._frame_buffer.put(isar.POISON_PILL)
+        self.stop_recording()
 
         # TODO: this hangs on stop! why? I don't know
         # self._capture.release()
@@ -118,32 +173,172 @@ class CameraService(Service):
         self._capture.release()
 
     def start_capture(self):
-        self._do_capture = True
+        self._capture_event.set()
 
     def stop_capture(self):
-        self._do_capture = False
+        self._capture_event.clear()
 
-    def get_frame(self, flipped_x=False, flipped_y=False):
+    def get_frame(self, flipped_x=False, flipped_y=False, newer_than=None, timeout=None, flip_buffer=None):
         """
-        Return the frame from FIFO queue
-        It blocks if the queue is empty.
-        :return:
+        Return the latest captured frame.
+        If newer_than is given, wait (at most timeout seconds, forever if timeout is None)
+        for a frame with a frame_number greater than newer_than.
+
+        The returned frame is shared with the other consumers and must not be modified.
+        Use CameraFrame.get_writable_scene_image() to draw on it.
+        If a flipped frame is requested, a flipped copy is returned. The copy is written into
+        flip_buffer if it is given (a preallocated array with the shape of the frame).
+        :return: the latest CameraFrame, POISON_PILL if the service is stopped,
+        None if no (new) frame is available.
         """
-        if not self._do_capture:
-            raise RuntimeError("_do_capture is False. Have you forgotten to call start_capture() first?")
+        if not self._capture_event.is_set():
+            raise RuntimeError("Capturing is not started. Have you forgotten to call start_capture() first?")
+
+        camera_frame = self._frame_buffer.get_latest(newer_than, timeout)
+        if camera_frame is None or camera_frame == isar.POISON_PILL:
+            return camera_frame
+
+        if flipped_x and flipped_y:
+            return camera_frame.flipped(-1, flip_buffer)
+        elif flipped_x:
+            return camera_frame.flipped(0, flip_buffer)
+        elif flipped_y:
+            return camera_frame.flipped(1, flip_buffer)
+        else:
+            return camera_frame
+
+    @staticmethod
+    def _put_calibration_frame(calibration_frames, camera_frame):
+        # keep only the latest frame, the calibration is slower than the camera
+        try:
+            calibration_frames.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            calibration_frames.put_nowait(camera_frame)
+        except queue.Full:
+            pass
+
+    def start_intrinsic_calibration(self):
+        t = threading.Thread(name="IntrinsicCalibrationThread", target=self.calibrate_intrinsics)
+        t.daemon = True
+        t.start()
 
-        if self._queue.empty():
-            # logger.warning("Camera _queue is empty! Return None.")
-            return None
+    def calibrate_intrinsics(self, num_images=MIN_CALIBRATION_IMAGES * 2, pattern_size=CHESSBOARD_PATTERN_SIZE,
+                             interval=0.5):
+        """
+        One-time intrinsic calibration of the camera. A printed chessboard must be held in front of the camera
+        and moved to different positions and orientations while the calibration runs.
+        The calibration runs on private copies of the distorted frames, the consumers keep getting the frames
+        undistorted with the current calibration (if any) until the new one is ready.
+        The calibration and the undistortion lookup tables are saved to calibration_path, and are used from
+        now on to undistort the frames.
+        :param num_images: number of chessboard images to collect
+        :param interval: minimum time between two collected images in sec
+        :return: True if the calibration was successful.
+        """
+        if self.calibration_path is None:
+            logger.error("calibration_path is None. Cannot calibrate the camera.")
+            return False
+
+        if self.replay_path is not None:
+            logger.error("The replayed frames are undistorted already. Cannot calibrate the camera.")
+            return False
+
+        logger.info("Intrinsic calibration started. Hold the chessboard in front of the camera.")
+        calibration_frames = queue.Queue(maxsize=1)
+        self._calibration_frames = calibration_frames
+        chessboard_images = []
+        try:
+            while len(chessboard_images) < num_images:
+                if self._stop_event.is_set():
+                    return False
+
+                try:
+                    camera_frame = calibration_frames.get(timeout=isar.CAMERA_FRAME_TIMEOUT)
+                except queue.Empty:
+                    continue
+
+                if find_chessboard_corners(camera_frame.gray, pattern_size) is not None:
+                    chessboard_images.append(camera_frame.gray)
+                    logger.info("Collected chessboard image {} of {}".format(len(chessboard_images), num_images))
+                    time.sleep(interval)
+        finally:
+            self._calibration_frames = None
+
+        camera_matrix, dist_coeffs, frame_size = calibrate_camera(chessboard_images, pattern_size)
+        if camera_matrix is None:
+            return False
+
+        undistorter = Undistorter(camera_matrix, dist_coeffs, frame_size)
+        undistorter.save(self.calibration_path)
+        self._undistorter = undistorter
+        logger.info("Intrinsic calibration saved to {}".format(self.calibration_path))
+        return True
+
+    def set_scene_rect(self, scene_rect_c):
+        """
+        Set the scene rect (x, y, width, height in camera coordinates) computed from the scene markers.
+        All the frames captured after this carry the scene rect, and consumers can process only
+        the scene area using CameraFrame.scene_view. None means the whole frame.
+        """
+        if scene_rect_c is not None:
+            width, height = self.get_camera_capture_size()
+            x = max(0, int(scene_rect_c[0]))
+            y = max(0, int(scene_rect_c[1]))
+            scene_rect_c = (x, y,
+                            min(int(scene_rect_c[2]), width - x),
+                            min(int(scene_rect_c[3]), height - y))
+        self._scene_rect = scene_rect_c
+        logger.info("Scene rect of the camera frames: {}".format(scene_rect_c))
+
+    def get_scene_rect(self):
+        return self._scene_rect
+
+    def start_recording(self, video_path):
+        """
+        Record the captured frames to video_path, plus a sidecar index with the frame numbers and capture timestamps.
+        The recording can be replayed with the replay_path of a CameraService.
+        """
+        self.stop_recording()
 
-        camera_frame = self._queue.get()
-        if flipped_x:
-            camera_frame.flip(0)
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        if fps is None or fps <= 0:
+            fps = 30
 
-        if flipped_y:
-            camera_frame.flip(1)
+        recorder = FrameRecorder(video_path, fps=fps)
+        recorder.start()
+        self._recorder = recorder
 
-        return camera_frame
+    def stop_recording(self):
+        recorder = self._recorder
+        self._recorder = None
+        if recorder is not None:
+            recorder.stop()
+
+    def subscribe(self, name, rate=None):
+        """
+        Subscribe a consumer to the frames of this camera.
+        All subscribers share the same frames, but each one has its own cursor (the last frame it has consumed).
+        :param name: name of the consumer, used for logging
+        :param rate: the maximum number of frames per second the consumer wants. None means every new frame.
+        :return: a FrameSubscription
+        """
+        subscription = FrameSubscription(self, name, rate)
+        with self._subscriptions_lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._subscriptions_lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+                logger.info("Unsubscribed {}. Received {} frames, skipped {} frames.".format(
+                    subscription.name, subscription.num_received, subscription.num_skipped))
+
+    def get_subscriptions(self):
+        with self._subscriptions_lock:
+            return tuple(self._subscriptions)
 
     def get_camera_capture_size(self):
         if self._capture:
@@ -154,24 +349,355 @@ class CameraService(Service):
             return None
 
 
+class FrameSubscription:
+    """
+    The cursor of one consumer onto the frames of a CameraService.
+    Each subscriber gets the latest frame it has not seen yet, at most `rate` frames per second,
+    without taking the frame away from the other subscribers.
+    Flipped frames are written in a buffer owned by the subscription, they are valid until the next get_frame() call.
+    """
+    def __init__(self, camera_service, name, rate=None):
+        self.name = name
+        self.rate = rate
+        self.last_frame_number = -1
+        self.num_received = 0
+        self.num_skipped = 0
+        self._camera_service = camera_service
+        self._last_delivery_time = 0
+        self._flip_buffer = None
+
+    def get_frame(self, timeout=0, flipped_x=False, flipped_y=False):
+        """
+        Return the latest frame that this subscriber has not seen yet.
+        If the subscription has a rate, the frame is not delivered before 1 / rate seconds
+        have passed since the last delivery.
+        :param timeout: seconds to wait for a new frame. 0 returns immediately, None waits forever.
+        :return: a CameraFrame, POISON_PILL if the camera service is stopped,
+        None if no new frame is available within the timeout.
+        """
+        if self.rate:
+            wait_time = self._last_delivery_time + 1 / self.rate - time.time()
+            if wait_time > 0:
+                if timeout is not None and wait_time > timeout:
+                    time.sleep(timeout)
+                    return None
+
+                time.sleep(wait_time)
+                if timeout is not None:
+                    timeout -= wait_time
+
+        flip_buffer = self._flip_buffer if flipped_x or flipped_y else None
+        camera_frame = self._camera_service.get_frame(flipped_x, flipped_y,
+                                                      newer_than=self.last_frame_number,
+                                                      timeout=timeout,
+                                                      flip_buffer=flip_buffer)
+        if camera_frame is None or camera_frame == isar.POISON_PILL:
+            return camera_frame
+
+        if flipped_x or flipped_y:
+            # the flipped frames of this subscription are always written in the same buffer
+            self._flip_buffer = camera_frame.raw_image
+
+        if self.last_frame_number != -1:
+            self.num_skipped += max(0, camera_frame.frame_number - self.last_frame_number - 1)
+        self.num_received += 1
+        self.last_frame_number = camera_frame.frame_number
+        self._last_delivery_time = time.time()
+        return camera_frame
+
+
+class FrameRingBuffer:
+    """
+    A fixed-size ring buffer of the most recent camera frames plus a "latest frame" slot.
+    The capture thread puts the frames, the consumers wait on a condition variable for a frame
+    newer than the one they have already seen.
+    Once a POISON_PILL is put, it stays the latest frame: the frames put after it are ignored.
+    """
+    def __init__(self, size):
+        self._frames = [None] * size
+        self._latest = None
+        self._condition = threading.Condition()
+
+    def put(self, camera_frame):
+        with self._condition:
+            if self._latest == isar.POISON_PILL:
+                return
+
+            if camera_frame != isar.POISON_PILL:
+                self._frames[camera_frame.frame_number % len(self._frames)] = camera_frame
+            self._latest = camera_frame
+            self._condition.notify_all()
+
+    def get_latest(self, newer_than=None, timeout=None):
+        """
+        :param newer_than: if not None, wait for a frame with a frame_number greater than this.
+        :param timeout: maximum time in seconds to wait for a newer frame. None means wait forever.
+        :return: the latest frame, or None if no newer frame arrived within the timeout.
+        """
+        with self._condition:
+            if newer_than is None:
+                return self._latest
+
+            if self._condition.wait_for(lambda: self._is_newer(self._latest, newer_than), timeout):
+                return self._latest
+            else:
+                return None
+
+    def get(self, frame_number):
+        """
+        :return: the frame with the given frame_number, if it is still in the buffer, None otherwise.
+        """
+        with self._condition:
+            camera_frame = self._frames[frame_number % len(self._frames)]
+            if camera_frame is not None and camera_frame.frame_number == frame_number:
+                return camera_frame
+            return None
+
+    def clear(self):
+        with self._condition:
+            self._frames = [None] * len(self._frames)
+            self._latest = None
+
+    @staticmethod
+    def _is_newer(camera_frame, frame_number):
+        if camera_frame is None:
+            return False
+
+        if camera_frame == isar.POISON_PILL:
+            return True
+
+        return camera_frame.frame_number > frame_number
+
+
 class CameraFrame:
     """
-    An OpenCV image plus the frame number
+    An OpenCV image plus the frame number and the capture timestamp
+
+    The scene_image is copy-on-write: reading it returns the raw_image,
+    the copy is only created when a writer asks for it with get_writable_scene_image().
+
+    The grayscale plane (gray) and its half and quarter resolution versions (half, quarter) are computed
+    once on first access and shared by all consumers of the frame. They must not be modified.
+
+    If the scene rect is known, scene_view is a zero-copy view on the scene area of the raw image,
+    and get_scene_plane() slices the scene area from the other planes. The image of a frame can itself be
+    a part of the camera image (e.g. the scene area sent to a worker process): then offset is the position
+    of its top-left corner in camera coordinates.
+
+    A frame can also be created from the encoded (MJPEG) buffer of the camera. Then the raw_image is only decoded
+    when a consumer asks for it, and the reduced planes (half, quarter, get_reduced_image()) are decoded directly
+    at the reduced resolution by the JPEG decoder, without decoding the full resolution image.
     """
-    def __init__(self, image, frame_number):
-        self.raw_image = image
-        self.scene_image = image.copy()
+
+    REDUCED_GRAYSCALE_FLAGS = {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4}
+    REDUCED_COLOR_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4}
+
+    def __init__(self, image, frame_number, timestamp=None, encoded_image=None, size=None, offset=(0, 0)):
+        """
+        :param image: the decoded image, None if the frame is created from the encoded_image
+        :param encoded_image: the encoded (JPEG) buffer of the image
+        :param size: (width, height) of the image, used if the image is not decoded yet
+        :param offset: position of the top-left corner of the image in camera coordinates
+        """
+        self._raw_image = image
+        self._encoded_image = encoded_image
+        self._size = size
+        self._scene_image = None
         self.frame_number = frame_number
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.offset = offset
+        self.scene_rect = None
+
+        # Two consumers accessing a plane at the same time may both compute it. That is harmless,
+        # the result is the same and one of them is kept. Only decoding the full image is guarded by a lock,
+        # because it is the most expensive one.
+        self._decode_lock = threading.Lock()
+        self._gray = None
+        self._half = None
+        self._quarter = None
+        self._reduced_images = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_decode_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._decode_lock = threading.Lock()
+
+    @property
+    def raw_image(self):
+        if self._raw_image is None and self._encoded_image is not None:
+            with self._decode_lock:
+                if self._raw_image is None:
+                    self._raw_image = self._decode(cv2.IMREAD_COLOR)
+        return self._raw_image
+
+    @raw_image.setter
+    def raw_image(self, image):
+        self._raw_image = image
+        self._encoded_image = None
+
+    @property
+    def is_decoded(self):
+        return self._raw_image is not None
+
+    @property
+    def scene_image(self):
+        """
+        Read-only access to the scene image. Use get_writable_scene_image() to draw on it.
+        """
+        if self._scene_image is None:
+            return self.raw_image
+        return self._scene_image
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            if not self.is_decoded and self._encoded_image is not None:
+                self._gray = self._decode(cv2.IMREAD_GRAYSCALE)
+            elif len(self.raw_image.shape) == 2:
+                self._gray = self.raw_image
+            else:
+                self._gray = cv2.cvtColor(self.raw_image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def half(self):
+        """
+        The grayscale plane at half resolution
+        """
+        if self._half is None:
+            if not self.is_decoded and self._encoded_image is not None:
+                self._half = self._decode(CameraFrame.REDUCED_GRAYSCALE_FLAGS[2])
+            else:
+                self._half = cv2.resize(self.gray, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        return self._half
+
+    @property
+    def quarter(self):
+        """
+        The grayscale plane at quarter resolution
+        """
+        if self._quarter is None:
+            if not self.is_decoded and self._encoded_image is not None:
+                self._quarter = self._decode(CameraFrame.REDUCED_GRAYSCALE_FLAGS[4])
+            else:
+                self._quarter = cv2.resize(self.half, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        return self._quarter
+
+    @property
+    def scene_view(self):
+        """
+        Zero-copy view on the scene area of the raw image, the whole raw image if the scene rect is not known.
+        """
+        return self.get_scene_plane(self.raw_image)
+
+    @property
+    def scene_offset(self):
+        """
+        Position of the top-left corner of scene_view in camera coordinates
+        """
+        if self.scene_rect is None:
+            return self.offset
+        return self.offset[0] + self.scene_rect[0], self.offset[1] + self.scene_rect[1]
+
+    def get_scene_plane(self, plane, scale=1.):
+        """
+        :param plane: an image of this frame, e.g. raw_image, gray, or half
+        :param scale: the resolution of the plane relative to the raw image, e.g. 0.5 for half
+        :return: zero-copy view on the scene area of the plane
+        """
+        if self.scene_rect is None:
+            return plane
+
+        x, y, width, height = [int(v * scale) for v in self.scene_rect]
+        return plane[y:y + height, x:x + width]
+
+    def get_reduced_image(self, factor):
+        """
+        :param factor: 2 or 4
+        :return: the color image at 1 / factor resolution
+        """
+        if factor not in CameraFrame.REDUCED_COLOR_FLAGS:
+            raise ValueError("Reduction factor must be 2 or 4, not {}".format(factor))
+
+        reduced_image = self._reduced_images.get(factor)
+        if reduced_image is None:
+            if not self.is_decoded and self._encoded_image is not None:
+                reduced_image = self._decode(CameraFrame.REDUCED_COLOR_FLAGS[factor])
+            else:
+                reduced_image = cv2.resize(self.raw_image, None, fx=1 / factor, fy=1 / factor,
+                                           interpolation=cv2.INTER_AREA)
+            self._reduced_images[factor] = reduced_image
+        return reduced_image
+
+    def get_writable_scene_image(self):
+        if self._scene_image is None:
+            self._scene_image = self.raw_image.copy()
+        return self._scene_image
 
     def flip(self, flip_code):
+        """
+        Flip the frame in place.
+        """
         # flipCode	a flag to specify how to flip the array;
         # 0 means flipping around the x-axis and
         # positive value (for example, 1) means flipping around y-axis.
         # Negative value (for example, -1) means flipping around both axes.
-        self.raw_image = cv2.flip(self.raw_image, flip_code)
-        self.scene_image = cv2.flip(self.scene_image, flip_code)
+        cv2.flip(self.raw_image, flip_code, dst=self.raw_image)
+        if self._scene_image is not None:
+            cv2.flip(self._scene_image, flip_code, dst=self._scene_image)
+        self.scene_rect = self._get_flipped_scene_rect(flip_code)
+
+        # the encoded image is not flipped
+        self._encoded_image = None
+        self._gray = None
+        self._half = None
+        self._quarter = None
+        self._reduced_images = {}
+
+    def flipped(self, flip_code, buffer=None):
+        """
+        :param buffer: a preallocated array to write the flipped image into.
+        A new array is allocated if it is None or has not the shape of the frame.
+        :return: a new CameraFrame with the flipped image. This frame is not changed.
+        The image is flipped in place of the camera area it covers, so the new frame has the same offset
+        and the scene rect flipped with the image.
+        """
+        if buffer is not None and (buffer.shape != self.raw_image.shape or buffer.dtype != self.raw_image.dtype):
+            buffer = None
+
+        flipped_image = cv2.flip(self.raw_image, flip_code, dst=buffer)
+        flipped_frame = CameraFrame(flipped_image, self.frame_number, self.timestamp, offset=self.offset)
+        flipped_frame.scene_rect = self._get_flipped_scene_rect(flip_code)
+        return flipped_frame
+
+    def _get_flipped_scene_rect(self, flip_code):
+        """
+        :return: the scene rect mirrored like cv2.flip(flip_code) mirrors the raw image
+        """
+        if self.scene_rect is None:
+            return None
+
+        x, y, width, height = self.scene_rect
+        image_width, image_height = self.size
+        # 0: around the x-axis, > 0: around the y-axis, < 0: around both axes
+        if flip_code <= 0:
+            y = image_height - y - height
+        if flip_code != 0:
+            x = image_width - x - width
+        return x, y, width, height
 
     @property
     def size(self):
+        if not self.is_decoded and self._size is not None:
+            return self._size
         return self.raw_image.shape[1], self.raw_image.shape[0]
 
+    def _decode(self, flags):
+        image = cv2.imdecode(self._encoded_image, flags)
+        if image is None:
+            logger.error("Could not decode frame {}.".format(self.frame_number))
+        return image
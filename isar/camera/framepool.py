@@ -0,0 +1,143 @@
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from isar.camera.camera import CameraFrame
+
+logger = logging.getLogger("isar.camera.framepool")
+
+
+"""
+Camera frames are big (a 1920x1080x3 image is about 6 MB). Pickling them through multiprocessing queues
+costs a full serialisation and copy per frame per process.
+
+A SharedFramePool is a fixed number of frame slots in one shared memory block. The producer copies the image
+once into a free slot and sends only a SharedFrameHandle (slot index plus frame metadata) through the queue.
+The consumer process maps the slot as a numpy array without copying.
+
+Each slot has a reference count: the producer sets it to the number of readers the frame is sent to, each reader
+releases the slot after it is done with the frame. A slot is reused only if its reference count is zero.
+
+The pool must be created in the main process before the consumer processes are started,
+and given to the consumer processes as constructor argument (i.e. by inheritance, not through a queue).
+"""
+
+
+class SharedFrameHandle:
+    """
+    The slot index of a frame in a SharedFramePool plus the frame metadata.
+    """
+    def __init__(self, slot, frame_number, timestamp, shape, dtype, offset=(0, 0), scale=1.):
+        """
+        :param offset: position of the top-left corner of the image in camera coordinates
+        :param scale: resolution of the image relative to the camera image
+        """
+        self.slot = slot
+        self.frame_number = frame_number
+        self.timestamp = timestamp
+        self.shape = shape
+        self.dtype = dtype
+        self.offset = offset
+        self.scale = scale
+
+
+class SharedFramePool:
+    def __init__(self, num_slots, frame_size, channels=3):
+        """
+        :param num_slots: number of frames that can be in flight at the same time
+        :param frame_size: (width, height) of the biggest frame that is put in the pool
+        :param channels: number of channels of the biggest frame that is put in the pool
+        """
+        width, height = frame_size
+        self.num_slots = num_slots
+        self.slot_size = width * height * channels
+        self._shm = shared_memory.SharedMemory(create=True, size=self.num_slots * self.slot_size)
+        self._ref_counts = mp.Array("i", self.num_slots)
+        self._next_slot = 0
+        self._is_owner = True
+
+    def __getstate__(self):
+        # only needed if the consumer processes are spawned (not forked).
+        return {"name": self._shm.name,
+                "num_slots": self.num_slots,
+                "slot_size": self.slot_size,
+                "ref_counts": self._ref_counts}
+
+    def __setstate__(self, state):
+        self.num_slots = state["num_slots"]
+        self.slot_size = state["slot_size"]
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._ref_counts = state["ref_counts"]
+        self._next_slot = 0
+        self._is_owner = False
+
+    def put(self, camera_frame, num_readers=1, image=None, offset=(0, 0), scale=1.):
+        """
+        Copy the raw image of the camera frame in a free slot.
+        :param num_readers: number of consumers that will release the slot
+        :param image: the image of the frame to put in the slot instead of raw image, e.g. camera_frame.half
+        or camera_frame.scene_view
+        :param offset: position of the top-left corner of image in camera coordinates
+        :param scale: resolution of image relative to the camera image
+        :return: a SharedFrameHandle, or None if all slots are in use.
+        """
+        if image is None:
+            image = camera_frame.raw_image
+
+        if image.nbytes > self.slot_size:
+            raise ValueError("Frame of shape {} does not fit in a slot of {} bytes.".format(image.shape,
+                                                                                         self.slot_size))
+
+        slot = self._acquire_slot(num_readers)
+        if slot is None:
+            logger.debug("All {} slots of the frame pool are in use.".format(self.num_slots))
+            return None
+
+        self._get_slot_array(slot, image.shape, image.dtype)[...] = image
+        return SharedFrameHandle(slot, camera_frame.frame_number, camera_frame.timestamp,
+                                 image.shape, image.dtype, offset, scale)
+
+    def get(self, frame_handle):
+        """
+        :return: a CameraFrame whose raw image is a view on the shared memory slot.
+        The frame is only valid until the handle is released.
+        """
+        image = self._get_slot_array(frame_handle.slot, frame_handle.shape, frame_handle.dtype)
+        return CameraFrame(image, frame_handle.frame_number, frame_handle.timestamp, offset=frame_handle.offset)
+
+    def release(self, frame_handle):
+        with self._ref_counts.get_lock():
+            if self._ref_counts[frame_handle.slot] > 0:
+                self._ref_counts[frame_handle.slot] -= 1
+
+    def reset(self):
+        """
+        Mark all slots as free, e.g. after a consumer process has died without releasing its slots.
+        """
+        with self._ref_counts.get_lock():
+            for slot in range(self.num_slots):
+                self._ref_counts[slot] = 0
+
+    def close(self):
+        try:
+            self._shm.close()
+        except BufferError:
+            logger.warning("Frame pool is closed while frames are still in use.")
+
+        if self._is_owner:
+            self._shm.unlink()
+
+    def _acquire_slot(self, num_readers):
+        with self._ref_counts.get_lock():
+            for i in range(self.num_slots):
+                slot = (self._next_slot + i) % self.num_slots
+                if self._ref_counts[slot] == 0:
+                    self._ref_counts[slot] = num_readers
+                    self._next_slot = (slot + 1) % self.num_slots
+                    return slot
+        return None
+
+    def _get_slot_array(self, slot, shape, dtype):
+        return np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=slot * self.slot_size)
@@ -0,0 +1,142 @@
+import collections
+import csv
+import logging
+import os
+import threading
+import traceback
+
+import cv2
+
+logger = logging.getLogger("isar.camera.recorder")
+
+
+INDEX_FILE_SUFFIX = ".index.csv"
+INDEX_HEADER = ("video_frame", "frame_number", "timestamp")
+
+
+def get_index_path(video_path):
+    """
+    :return: path of the sidecar index of a recorded video.
+    The index has one row per video frame with the camera frame number and capture timestamp of the frame.
+    """
+    return os.path.splitext(video_path)[0] + INDEX_FILE_SUFFIX
+
+
+def read_index(video_path):
+    """
+    :return: the list of (frame_number, timestamp) of the video frames, or None if the video has no index.
+    """
+    index_path = get_index_path(video_path)
+    if not os.path.isfile(index_path):
+        return None
+
+    index = []
+    with open(index_path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            index.append((int(row[1]), float(row[2])))
+    return index
+
+
+class FrameRecorder:
+    """
+    Records camera frames to an encoded video file plus a sidecar index with the frame numbers
+    and capture timestamps of the frames.
+
+    Frames are written on a separate writer thread. add_frame() never blocks: the frames wait in a bounded queue,
+    if the writer falls behind the oldest frames are dropped. The dropped frames are missing from the video and
+    from the index, the frame numbers in the index show the gaps.
+    """
+
+    def __init__(self, video_path, fps=30, queue_size=30, fourcc="MJPG"):
+        self.video_path = video_path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.num_written = 0
+        self.num_dropped = 0
+
+        self._queue = collections.deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._writer_thread = None
+
+    def start(self):
+        self._writer_thread = threading.Thread(name="FrameRecorderThread", target=self._write_frames)
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+        logger.info("Start recording to {}".format(self.video_path))
+
+    def add_frame(self, camera_frame):
+        with self._condition:
+            if self._stopped:
+                return
+
+            if len(self._queue) == self._queue.maxlen:
+                self.num_dropped += 1
+
+            # deque with maxlen drops the oldest frame
+            self._queue.append(camera_frame)
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Stop recording. The frames that are still in the queue are written before the files are closed.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+        if self._writer_thread is not None:
+            self._writer_thread.join()
+
+        logger.info("Stopped recording to {}. Written frames: {}, dropped frames: {}".format(
+            self.video_path, self.num_written, self.num_dropped))
+
+    def _write_frames(self):
+        video_writer = None
+        with open(get_index_path(self.video_path), "w", newline="") as index_file:
+            index_writer = csv.writer(index_file)
+            index_writer.writerow(INDEX_HEADER)
+            try:
+                while True:
+                    with self._condition:
+                        self._condition.wait_for(lambda: self._stopped or len(self._queue) > 0)
+                        if len(self._queue) == 0:
+                            break
+                        camera_frame = self._queue.popleft()
+
+                    image = camera_frame.raw_image
+                    if video_writer is None:
+                        video_writer = cv2.VideoWriter(self.video_path,
+                                                       cv2.VideoWriter_fourcc(*self.fourcc),
+                                                       self.fps,
+                                                       (image.shape[1], image.shape[0]))
+                        if not video_writer.isOpened():
+                            logger.error("Could not open the video writer for {} with fourcc {}. "
+                                         "Stop recording.".format(self.video_path, self.fourcc))
+                            self.num_dropped += 1
+                            self._stop_writing()
+                            break
+
+                    video_writer.write(image)
+                    index_writer.writerow((self.num_written, camera_frame.frame_number, camera_frame.timestamp))
+                    self.num_written += 1
+
+            except Exception as exp:
+                logger.error("Error recording frames to {}".format(self.video_path))
+                logger.error(exp)
+                traceback.print_tb(exp.__traceback__)
+                self._stop_writing()
+            finally:
+                if video_writer is not None:
+                    video_writer.release()
+
+    def _stop_writing(self):
+        """
+        Stop recording after an error of the writer thread, the frames in the queue and the new frames are dropped.
+        """
+        with self._condition:
+            self._stopped = True
+            self.num_dropped += len(self._queue)
+            self._queue.clear()
@@ -0,0 +1,160 @@
+import logging
+import os
+import time
+
+import cv2
+
+from isar.camera import recorder
+
+logger = logging.getLogger("isar.camera.replay")
+
+
+IMAGE_FILE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class ReplayCapture:
+    """
+    Replays a recorded video file or a directory of frame images with the same interface as cv2.VideoCapture,
+    so that the CameraService can be used without a camera attached.
+
+    If realtime is True, the frames are delivered at their recorded timestamps
+    (the capture timestamps from the sidecar index of videos recorded by the FrameRecorder, the video position for
+    other video files, 1 / fps for image directories). Otherwise they are delivered as fast as they can be read.
+    """
+
+    def __init__(self, path, realtime=True, fps=30, loop=True):
+        self.path = path
+        self.realtime = realtime
+        self.fps = fps
+        self.loop = loop
+
+        self._video = None
+        self._video_index = None
+        self._image_files = None
+        self._frame_index = 0
+        self._frame_size = None
+
+        # wall clock time and recorded timestamp of the first frame delivered since (re)start
+        self._start_time = None
+        self._start_timestamp = None
+
+        self._open()
+
+    def _open(self):
+        if os.path.isdir(self.path):
+            self._image_files = sorted(os.path.join(self.path, file_name) for file_name in os.listdir(self.path)
+                                       if os.path.splitext(file_name)[1].lower() in IMAGE_FILE_EXTENSIONS)
+            if len(self._image_files) == 0:
+                logger.error("No frame images found in {}".format(self.path))
+                self._image_files = None
+        elif os.path.isfile(self.path):
+            self._video = cv2.VideoCapture(self.path)
+            video_fps = self._video.get(cv2.CAP_PROP_FPS)
+            if video_fps > 0:
+                self.fps = video_fps
+            self._video_index = recorder.read_index(self.path)
+        else:
+            logger.error("Replay path {} does not exist.".format(self.path))
+
+    def isOpened(self):
+        if self._video is not None:
+            return self._video.isOpened()
+        return self._image_files is not None
+
+    def read(self):
+        ret, frame, timestamp = self._read_next()
+        if not ret and self.loop and self._frame_index > 0:
+            logger.info("Reached the end of {}. Start over.".format(self.path))
+            self._rewind()
+            ret, frame, timestamp = self._read_next()
+
+        if not ret:
+            return False, None
+
+        if self._frame_size is None:
+            self._frame_size = (frame.shape[1], frame.shape[0])
+
+        if self.realtime:
+            self._wait_until(timestamp)
+
+        return True, frame
+
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH or prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            frame_size = self._get_frame_size()
+            if frame_size is None:
+                return 0
+            return frame_size[0] if prop_id == cv2.CAP_PROP_FRAME_WIDTH else frame_size[1]
+
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+
+        if self._video is not None:
+            return self._video.get(prop_id)
+
+        return 0
+
+    def set(self, prop_id, value):
+        # The properties of a recording cannot be changed.
+        return False
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+    def _read_next(self):
+        """
+        :return: ret, frame, recorded timestamp of the frame in sec
+        """
+        if self._video is not None:
+            # position of the frame that is read next
+            timestamp = self._video.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if self._video_index is not None and self._frame_index < len(self._video_index):
+                timestamp = self._video_index[self._frame_index][1]
+            elif timestamp <= 0 < self._frame_index:
+                timestamp = self._frame_index / self.fps
+            ret, frame = self._video.read()
+        elif self._image_files is not None and self._frame_index < len(self._image_files):
+            frame = cv2.imread(self._image_files[self._frame_index])
+            ret = frame is not None
+            timestamp = self._frame_index / self.fps
+        else:
+            return False, None, None
+
+        if ret:
+            self._frame_index += 1
+
+        return ret, frame, timestamp
+
+    def _rewind(self):
+        self._frame_index = 0
+        self._start_time = None
+        self._start_timestamp = None
+        if self._video is not None:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _wait_until(self, timestamp):
+        if self._start_time is None:
+            self._start_time = time.time()
+            self._start_timestamp = timestamp
+            return
+
+        wait_time = (timestamp - self._start_timestamp) - (time.time() - self._start_time)
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def _get_frame_size(self):
+        if self._frame_size is not None:
+            return self._frame_size
+
+        if self._video is not None:
+            width = self._video.get(cv2.CAP_PROP_FRAME_WIDTH)
+            height = self._video.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            if width > 0 and height > 0:
+                self._frame_size = (int(width), int(height))
+        elif self._image_files is not None:
+            image = cv2.imread(self._image_files[0])
+            if image is not None:
+                self._frame_size = (image.shape[1], image.shape[0])
+
+        return self._frame_size
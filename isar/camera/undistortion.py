@@ -0,0 +1,121 @@
+import logging
+import os
+import sys
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("isar.camera.undistortion")
+
+
+"""
+Removing the lens distortion of the camera.
+
+The intrinsic calibration (camera matrix and distortion coefficients) is done once with images of a printed
+chessboard held in different positions and orientations in front of the camera. From the calibration the
+undistortion lookup tables (cv2.initUndistortRectifyMap) are computed and stored on disk together with the
+calibration. At startup the CameraService loads the lookup tables and undistorts every frame with cv2.remap.
+"""
+
+CHESSBOARD_PATTERN_SIZE = (9, 6)   # number of inner corners per row and column
+MIN_CALIBRATION_IMAGES = 10
+
+
+def find_chessboard_corners(image, pattern_size=CHESSBOARD_PATTERN_SIZE):
+    """
+    :return: the refined chessboard corners in the image, None if the chessboard is not found.
+    """
+    gray = image if len(image.shape) == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    found, corners = cv2.findChessboardCorners(gray, pattern_size, None)
+    if not found:
+        return None
+
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+
+
+def calibrate_camera(images, pattern_size=CHESSBOARD_PATTERN_SIZE):
+    """
+    Compute the camera matrix and the distortion coefficients from images of a chessboard.
+    :return: camera_matrix, dist_coeffs, frame_size, or None, None, None if there are not enough chessboard images.
+    """
+    object_points = np.zeros((pattern_size[0] * pattern_size[1], 3), np.float32)
+    object_points[:, :2] = np.mgrid[0:pattern_size[0], 0:pattern_size[1]].T.reshape(-1, 2)
+
+    all_object_points = []
+    all_image_points = []
+    frame_size = None
+    for image in images:
+        frame_size = (image.shape[1], image.shape[0])
+        corners = find_chessboard_corners(image, pattern_size)
+        if corners is not None:
+            all_object_points.append(object_points)
+            all_image_points.append(corners)
+
+    if len(all_image_points) < MIN_CALIBRATION_IMAGES:
+        logger.error("Chessboard found in {} images. At least {} images are needed for calibration.".format(
+            len(all_image_points), MIN_CALIBRATION_IMAGES))
+        return None, None, None
+
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(all_object_points, all_image_points,
+                                                                frame_size, None, None)
+    logger.info("Camera calibrated with {} images. RMS reprojection error: {}".format(len(all_image_points), rms))
+    return camera_matrix, dist_coeffs, frame_size
+
+
+class Undistorter:
+    """
+    Undistorts camera images with lookup tables precomputed from the camera calibration.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, frame_size, map1=None, map2=None):
+        self.camera_matrix = camera_matrix
+        self.dist_coeffs = dist_coeffs
+        self.frame_size = tuple(int(v) for v in frame_size)
+
+        if map1 is None or map2 is None:
+            # fixed point maps (CV_16SC2) make remap faster than floating point maps
+            map1, map2 = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None,
+                                                     self.camera_matrix, self.frame_size, cv2.CV_16SC2)
+        self.map1 = map1
+        self.map2 = map2
+
+    def undistort(self, image):
+        if (image.shape[1], image.shape[0]) != self.frame_size:
+            logger.warning("Image size {} does not match the calibration frame size {}. Not undistorted.".format(
+                (image.shape[1], image.shape[0]), self.frame_size))
+            return image
+
+        return cv2.remap(image, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    def save(self, path):
+        np.savez(path,
+                 camera_matrix=self.camera_matrix,
+                 dist_coeffs=self.dist_coeffs,
+                 frame_size=np.array(self.frame_size),
+                 map1=self.map1,
+                 map2=self.map2)
+        logger.info("Camera calibration saved to {}".format(path))
+
+    @staticmethod
+    def load(path):
+        """
+        :return: an Undistorter with the calibration and the lookup tables stored in path, None if path does not exist.
+        """
+        if path is None or not os.path.isfile(path):
+            return None
+
+        with np.load(path) as data:
+            return Undistorter(data["camera_matrix"], data["dist_coeffs"], data["frame_size"],
+                               data["map1"], data["map2"])
+
+
+if __name__ == "__main__":
+    # python -m isar.camera.undistortion <directory with chessboard images> <calibration file (.npz)>
+    images_dir, calibration_path = sys.argv[1], sys.argv[2]
+    chessboard_images = [cv2.imread(os.path.join(images_dir, file_name))
+                         for file_name in sorted(os.listdir(images_dir))]
+    chessboard_images = [image for image in chessboard_images if image is not None]
+    cam_matrix, distortion, size = calibrate_camera(chessboard_images)
+    if cam_matrix is not None:
+        Undistorter(cam_matrix, distortion, size).save(calibration_path)
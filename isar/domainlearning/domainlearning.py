@@ -15,12 +15,16 @@ from isar.scene.physicalobjectmodel import PhysicalObjectsModel
 from isar.scene.scenemodel import ScenesModel
 from isar.services import servicemanager
 from isar.services.servicemanager import ServiceNames
+from isar.tracking.boxtracking import BoxTracker
 
 
 logger = logging.getLogger("isar.domainlearning")
 
 
 class DomainLearningWindow(QMainWindow):
+    # the predictions of the object detection thread and callback are applied to the model in the GUI thread
+    present_objects_changed = QtCore.pyqtSignal(object)
+
     def __init__(self, screen_id):
         super().__init__()
         self.objects_view = None
@@ -28,6 +32,8 @@ class DomainLearningWindow(QMainWindow):
         self.projector_view = None
 
         self._camera_service: CameraService = None
+        self._projector_frames = None
+        self._object_detection_frames = None
         self.setup_camera_service()
 
         self.projector_initialized = self.setup_projector_view(screen_id)
@@ -38,6 +44,7 @@ class DomainLearningWindow(QMainWindow):
         self._object_detection_service = None
         self._selection_stick_service = None
         self._hand_tracking_service = None
+        self._box_tracker = BoxTracker() if isar.OBJECT_BOX_TRACKING else None
         self.setup_object_detection_service()
 
         self.setAttribute(QtCore.Qt.WA_QuitOnClose, True)
@@ -198,6 +205,7 @@ class DomainLearningWindow(QMainWindow):
         self.load_proj_btn.clicked.connect(self.load_project_btn_clicked)
         self.scenes_list.selectionModel().currentChanged.connect(self.sceneslist_current_changed)
         self.track_objects_checkbox.stateChanged.connect(self.toggle_object_tracking)
+        self.present_objects_changed.connect(self.physical_objects_model.update_present_physical_objects)
 
     def calibrate_projector(self):
         self.projector_view.calibrating = True
@@ -224,6 +232,9 @@ class DomainLearningWindow(QMainWindow):
     def setup_camera_service(self):
         self._camera_service = servicemanager.get_service(ServiceNames.CAMERA1)
         self._camera_service.start_capture()
+        self._projector_frames = self._camera_service.subscribe("DomainLearningProjectorView")
+        self._object_detection_frames = self._camera_service.subscribe("DomainLearningObjectDetection",
+                                                                        rate=1 / isar.OBJECT_DETECTION_INTERVAL)
 
     def setup_object_detection_service(self):
         self._object_detection_service = servicemanager.get_service(ServiceNames.OBJECT_DETECTION)
@@ -311,23 +322,39 @@ class DomainLearningWindow(QMainWindow):
         if self.projector_view.calibrating:
             return
         else:
-            camera_frame = self._camera_service.get_frame()
-            if camera_frame is None:
+            camera_frame = self._projector_frames.get_frame()
+            if camera_frame is None or camera_frame == isar.POISON_PILL:
                 return
 
+            if isar.OBJECT_TRACKING_ACTIVE and self._box_tracker is not None:
+                tracked_predictions = self._box_tracker.update(camera_frame)
+                if tracked_predictions is not None:
+                    self.physical_objects_model.update_present_physical_objects(tracked_predictions)
+
             self.projector_view.update_projector_view(camera_frame)
 
     def toggle_object_tracking(self):
         if self.track_objects_checkbox.isChecked():
             isar.OBJECT_TRACKING_ACTIVE = True
+            self.show_object_detection_readiness()
         else:
             isar.OBJECT_TRACKING_ACTIVE = False
 
+    def show_object_detection_readiness(self):
+        if not self.track_objects_checkbox.isChecked():
+            return
+
+        if self._object_detection_service.is_ready():
+            self.statusBar.showMessage("Object detectors are ready.", 3000)
+        else:
+            ready_names = self._object_detection_service.get_ready_object_detectors_names()
+            self.statusBar.showMessage("Loading object detectors... Ready: {}".format(", ".join(ready_names)))
+            QTimer.singleShot(500, self.show_object_detection_readiness)
+
     def run_object_detection(self):
         while True:
-            time.sleep(isar.OBJECT_DETECTION_INTERVAL)
             if isar.OBJECT_TRACKING_ACTIVE:
-                camera_frame = self._camera_service.get_frame()
+                camera_frame = self._object_detection_frames.get_frame(timeout=isar.OBJECT_DETECTION_INTERVAL)
                 if camera_frame == isar.POISON_PILL:
                     logger.info(
                         "Object detection thread in domain learning window got poison pill from camera. Break.")
@@ -340,14 +367,23 @@ class DomainLearningWindow(QMainWindow):
                                                                       scene_phys_objs_names,
                                                                       callback=self.on_obj_detection_complete)
             else:
+                time.sleep(isar.OBJECT_DETECTION_INTERVAL)
                 self._object_detection_service.stop_object_detection()
-                self.physical_objects_model.update_present_physical_objects(None)
+                if self._box_tracker is not None:
+                    self._box_tracker.reset()
+                self.present_objects_changed.emit(None)
 
     def on_obj_detection_complete(self, phys_obj_predictions):
-        self.physical_objects_model.update_present_physical_objects(phys_obj_predictions)
+        # called in the dispatcher thread of the object detection service
+        if self._box_tracker is not None:
+            # the predictions are made on an older frame, the tracked boxes have moved on since
+            phys_obj_predictions = self._box_tracker.anchor(phys_obj_predictions)
+        self.present_objects_changed.emit(phys_obj_predictions)
 
     def close(self):
         self._projector_view_timer.stop()
+        self._camera_service.unsubscribe(self._projector_frames)
+        self._camera_service.unsubscribe(self._object_detection_frames)
         self.projector_view.close()
         super().close()
 
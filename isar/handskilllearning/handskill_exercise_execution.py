@@ -6,6 +6,7 @@ from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtWidgets import QMainWindow, QFileDialog
 
+import isar
 from isar.camera.camera import CameraService
 from isar.handskilllearning.handskill_exercise_model import FollowThePathExercise, CatchTheObjectExercise
 from isar.projection.projector import ProjectorView
@@ -31,6 +32,7 @@ class HandSkillExerciseExecution(QMainWindow):
         self._projector_view_timer = None
 
         self._camera_service: CameraService = None
+        self._projector_frames = None
         self.setup_camera_service()
 
         self.projector_view = None
@@ -59,6 +61,7 @@ class HandSkillExerciseExecution(QMainWindow):
     def setup_camera_service(self):
         self._camera_service = servicemanager.get_service(ServiceNames.CAMERA1)
         self._camera_service.start_capture()
+        self._projector_frames = self._camera_service.subscribe("HandSkillExecutionProjectorView")
 
     def setup_projector_view(self, screen_id):
         self.projector_view = ProjectorView(self.projector_view, screen_id, self._camera_service)
@@ -183,14 +186,15 @@ class HandSkillExerciseExecution(QMainWindow):
         if self.projector_view.calibrating:
             return
         else:
-            camera_frame = self._camera_service.get_frame()
-            if camera_frame is None:
+            camera_frame = self._projector_frames.get_frame()
+            if camera_frame is None or camera_frame == isar.POISON_PILL:
                 return
 
             self.projector_view.update_projector_view(camera_frame)
 
     def close(self):
         self._projector_view_timer.stop()
+        self._camera_service.unsubscribe(self._projector_frames)
         self.projector_view.close()
         super().close()
 
@@ -43,6 +43,8 @@ class ProjectorView(QtWidgets.QWidget):
         self.image = None
         self.homography_matrix = np.identity(3, dtype=np.float64)
         self.camera_service: CameraService = camera_service
+        self._calibration_frames = camera_service.subscribe("ProjectorCalibration")
+        self._scene_size_frames = camera_service.subscribe("ProjectorSceneSize")
 
         self.__annotations_model = None
         self.__physical_objects_model = None
@@ -106,6 +108,11 @@ class ProjectorView(QtWidgets.QWidget):
     def is_projector_ready(self):
         return self.projector is not None and self.projector_width != 0 and self.projector_height != 0
 
+    def closeEvent(self, event):
+        self.camera_service.unsubscribe(self._calibration_frames)
+        self.camera_service.unsubscribe(self._scene_size_frames)
+        super().closeEvent(event)
+
     def paintEvent(self, event):
         qpainter = QtGui.QPainter()
         qpainter.begin(self)
@@ -163,7 +170,7 @@ class ProjectorView(QtWidgets.QWidget):
                 # projector_img = cv2.flip(projector_img, -1)
                 projector_points = projectionutil.get_chessboard_points("projector_points", projector_img)
 
-                camera_frame = self.camera_service.get_frame()
+                camera_frame = self._calibration_frames.get_frame(timeout=isar.CAMERA_FRAME_TIMEOUT)
                 if camera_frame is None:
                     continue
 
@@ -228,11 +235,15 @@ class ProjectorView(QtWidgets.QWidget):
         num_iter = -1
         while True:
             num_iter += 1
-            camera_frame = self.camera_service.get_frame()
+            camera_frame = self._scene_size_frames.get_frame(timeout=isar.CAMERA_FRAME_TIMEOUT)
             if camera_frame is None:
                 # logger.error("camera_frame is None")
                 continue
 
+            if camera_frame == isar.POISON_PILL:
+                logger.info("Initializing scene size received POISON_PILL from camera. Return.")
+                return
+
             # compute scene rect in projector-space
             scene_rect_c, scene_rect_p, scene_homography = sceneutil.compute_scene_rect(camera_frame,
                                                                                         self.homography_matrix)
@@ -248,6 +259,7 @@ class ProjectorView(QtWidgets.QWidget):
                     return
 
                 self.scene_rect_c = scene_rect_c
+                self.camera_service.set_scene_rect(scene_rect_c)
                 self.scene_rect_p = scene_rect_p
                 self.scene_size_p = (self.scene_rect_p[2], self.scene_rect_p[3])
                 self.scene_homography = scene_homography
@@ -282,15 +294,15 @@ class ProjectorView(QtWidgets.QWidget):
             logger.warning("Projector scene size is not initialized. Return!")
             return
 
-        camera_img = camera_frame.raw_image
-        if debug: cv2.imwrite("tmp/tmp_files/what_camera_sees_on_table.jpg", camera_img)
+        # the raw image is not needed to render the scene, don't decode it if it is not decoded yet.
+        if debug: cv2.imwrite("tmp/tmp_files/what_camera_sees_on_table.jpg", camera_frame.raw_image)
 
         projector_image = projectionutil.create_dummy_projector_image(self.projector_width,
                                                                       self.projector_height,
                                                                       self.scene_rect_p)
 
         if debug:
-            marker_cornerss, marker_ids, _ = cv2.aruco.detectMarkers(camera_img, sceneutil.aruco_dictionary)
+            marker_cornerss, marker_ids, _ = cv2.aruco.detectMarkers(camera_frame.gray, sceneutil.aruco_dictionary)
             for marker_corners in marker_cornerss:
                 marker_corners_p = cv2.perspectiveTransform(marker_corners, self.homography_matrix).squeeze()
                 cv2.line(projector_image, tuple(marker_corners_p[0]), tuple(marker_corners_p[1]), color=(255, 0, 255),
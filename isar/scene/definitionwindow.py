@@ -36,6 +36,9 @@ class SceneDefinitionWindow(QMainWindow):
         self.setup_ui()
 
         self._camera_service: CameraService = None
+        self._camera_view_frames = None
+        self._object_detection_frames = None
+        self._scene_size_frames = None
         self.setup_camera_service()
 
         self.scene_size_initialized = False
@@ -842,6 +845,17 @@ class SceneDefinitionWindow(QMainWindow):
     def setup_camera_service(self):
         self._camera_service = servicemanager.get_service(ServiceNames.CAMERA1)
         self._camera_service.start_capture()
+        self._camera_view_frames = self._camera_service.subscribe("SceneDefinitionCameraView")
+        self._object_detection_frames = self._camera_service.subscribe("SceneDefinitionObjectDetection",
+                                                                        rate=1 / isar.OBJECT_DETECTION_INTERVAL)
+        self._scene_size_frames = self._camera_service.subscribe("SceneDefinitionSceneSize")
+
+    def closeEvent(self, event):
+        self._camera_view_timer.stop()
+        self._camera_service.unsubscribe(self._camera_view_frames)
+        self._camera_service.unsubscribe(self._object_detection_frames)
+        self._camera_service.unsubscribe(self._scene_size_frames)
+        super().closeEvent(event)
 
     def setup_object_detection_service(self):
         self._object_detection_service = servicemanager.get_service(ServiceNames.OBJECT_DETECTION)
@@ -911,9 +925,9 @@ class SceneDefinitionWindow(QMainWindow):
         self.properties_view.setItemDelegate(annotation_property_item_delegate)
 
     def update_camera_view(self):
-        camera_frame = self._camera_service.get_frame()
+        camera_frame = self._camera_view_frames.get_frame()
 
-        if camera_frame is None:
+        if camera_frame is None or camera_frame == isar.POISON_PILL:
             # logger.error("camera_frame is None")
             return
 
@@ -925,14 +939,25 @@ class SceneDefinitionWindow(QMainWindow):
     def toggle_object_tracking(self):
         if self.track_objects_checkbox.isChecked():
             isar.OBJECT_TRACKING_ACTIVE = True
+            self.show_object_detection_readiness()
         else:
             isar.OBJECT_TRACKING_ACTIVE = False
 
+    def show_object_detection_readiness(self):
+        if not self.track_objects_checkbox.isChecked():
+            return
+
+        if self._object_detection_service.is_ready():
+            self.statusBar.showMessage("Object detectors are ready.", 3000)
+        else:
+            ready_names = self._object_detection_service.get_ready_object_detectors_names()
+            self.statusBar.showMessage("Loading object detectors... Ready: {}".format(", ".join(ready_names)))
+            QTimer.singleShot(500, self.show_object_detection_readiness)
+
     def run_object_detection(self):
         while True:
-            time.sleep(isar.OBJECT_DETECTION_INTERVAL)
             if isar.OBJECT_TRACKING_ACTIVE:
-                camera_frame = self._camera_service.get_frame()
+                camera_frame = self._object_detection_frames.get_frame(timeout=isar.OBJECT_DETECTION_INTERVAL)
                 if camera_frame == isar.POISON_PILL:
                     logger.info(
                         "Object detection thread in scene definition window got poison pill from camera. Break.")
@@ -945,6 +970,7 @@ class SceneDefinitionWindow(QMainWindow):
                                                                        scene_phys_objs_names,
                                                                        callback=self.on_obj_detection_complete)
             else:
+                time.sleep(isar.OBJECT_DETECTION_INTERVAL)
                 self._object_detection_service.stop_object_detection()
                 self.physical_objects_model.update_present_physical_objects(None)
 
@@ -956,17 +982,22 @@ class SceneDefinitionWindow(QMainWindow):
         num_iter = -1
         while True:
             num_iter += 1
-            camera_frame = self._camera_service.get_frame()
+            camera_frame = self._scene_size_frames.get_frame(timeout=isar.CAMERA_FRAME_TIMEOUT)
             if camera_frame is None:
                 # logger.error("camera_frame is None")
                 continue
 
+            if camera_frame == isar.POISON_PILL:
+                logger.info("Initializing scene size received POISON_PILL from camera. Return.")
+                return
+
             # compute scene rect in projector-space
             scene_rect_c, _, _ = sceneutil.compute_scene_rect(camera_frame)
             if scene_rect_c is None and num_iter < max_iter:
                 continue
             elif scene_rect_c is not None:
                 self.scene_rect = scene_rect_c
+                self._camera_service.set_scene_rect(scene_rect_c)
                 self.scene_size = (self.scene_rect[2], self.scene_rect[3])
                 self.scene_scale_factor_c = sceneutil.get_scene_scale_factor_c(
                     camera_frame.raw_image.shape, scene_rect_c)
@@ -987,6 +1018,7 @@ class SceneDefinitionWindow(QMainWindow):
     def reset_scene_size(self):
         # TODO: Experimental. Remove in production code. Also remove the button.
         self.scene_rect = None
+        self._camera_service.set_scene_rect(None)
         self.scene_size = None
         self.scene_size_initialized = False
 
@@ -1,15 +1,19 @@
 import logging
 import math
 import pickle
+import typing
 
 from PyQt5 import QtCore
 from PyQt5.QtCore import QAbstractListModel, Qt, QMimeData, QModelIndex
 from PyQt5.QtGui import QBrush
 
 from isar.scene import sceneutil
-from isar.scene.scenemodel import Scene
 from isar.scene.sceneutil import RefFrame
 
+# scenemodel imports physicalobjectmodel through the events, so it is imported only for the type checkers
+if typing.TYPE_CHECKING:
+    from isar.scene.scenemodel import Scene
+
 """
 Objects can be added in two ways to the scene: 
     a) 
@@ -179,11 +183,11 @@ class PhysicalObjectsModel(QAbstractListModel):
     def __init__(self):
         super().__init__()
         self.current_annotation = None
-        self.__scene: Scene = None
+        self.__scene: "Scene" = None
         self.__all_physical_objects = None
         self.__present_physical_objects = {}
 
-    def set_scene(self, scene: Scene):
+    def set_scene(self, scene: "Scene"):
         self.__scene = scene
 
     def rowCount(self, parent=None):
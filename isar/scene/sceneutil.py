@@ -208,7 +208,7 @@ def compute_scene_rect(camera_frame, cam_proj_homography=None):
     camera_img = camera_frame.raw_image
     # Detect the scene border markers and get the scene boudaries from them.
     # All scene images must be resized to scene boundaries and shown in the center of projector widget
-    marker_corners, marker_ids, _ = cv2.aruco.detectMarkers(camera_img, aruco_dictionary)
+    marker_corners, marker_ids, _ = cv2.aruco.detectMarkers(camera_frame.gray, aruco_dictionary)
     if marker_corners is None or marker_ids is None:
         logger.warning("marker_corners or marker_ids is None. Return.")
         return None, None, None
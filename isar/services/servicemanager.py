@@ -2,6 +2,7 @@ import logging
 import traceback
 from enum import Enum
 
+import isar
 from isar.camera.camera import CameraService
 from isar.events.actionsservice import ActionsService
 from isar.events.checkboxservice import CheckboxService
@@ -39,8 +40,16 @@ class ServiceNames(Enum):
 
 def start_services():
     try:
-        camera1_service = CameraService(ServiceNames.CAMERA1, 1)
+        camera1_service = CameraService(ServiceNames.CAMERA1, 1,
+                                        replay_path=isar.CAMERA_REPLAY_PATH,
+                                        replay_realtime=isar.CAMERA_REPLAY_REALTIME,
+                                        lazy_mjpeg_decode=isar.CAMERA_LAZY_MJPEG_DECODE,
+                                        calibration_path=isar.CAMERA_CALIBRATION_PATH)
         camera1_service.start()
+        if isar.CAMERA_RECORDING_PATH is not None and isar.CAMERA_REPLAY_PATH is None:
+            camera1_service.start_recording(isar.CAMERA_RECORDING_PATH)
+        if isar.CAMERA_CALIBRATE_INTRINSICS:
+            camera1_service.start_intrinsic_calibration()
         __services[ServiceNames.CAMERA1] = camera1_service
     except Exception as exp:
         logger.error("Could not initialize camera service. Return.")
@@ -0,0 +1,177 @@
+import collections
+import logging
+import threading
+
+import cv2
+import numpy as np
+
+from isar.tracking.objectdetection import ObjectDetectionPrediction
+
+logger = logging.getLogger("isar.boxtracking")
+
+
+"""
+The object detectors deliver predictions a few times per second, the projector is updated every camera frame.
+The BoxTracker moves the boxes of the last predictions with the camera frames in between, using sparse optical flow
+(Lucas-Kanade) on the half resolution grayscale planes of the frames.
+
+The pose estimation of a prediction is relative to its box, so it moves with the box.
+
+When new predictions arrive, the tracker is re-anchored on them. The predictions are made on an older frame;
+if the frame is still in the history of the tracker, the boxes are moved from it to the latest frame at once.
+anchor() returns the predictions moved to the latest frame, to be used instead of the predictions of the older frame.
+"""
+
+
+class BoxTrack:
+    MAX_POINTS = 30
+    MIN_POINTS = 5
+
+    def __init__(self, obj_detector_name, prediction):
+        self.obj_detector_name = obj_detector_name
+        self.prediction = prediction
+        self.frame_number = prediction.frame_number
+        self.top_left = np.array(prediction.top_left, dtype=np.float32)
+        self.bottom_right = np.array(prediction.bottom_right, dtype=np.float32)
+        self._points = None
+
+    def propagate(self, prev_gray, gray, scale=0.5):
+        """
+        Move the box with the median optical flow of the feature points in it from prev_gray to gray.
+        :param scale: the resolution of the gray planes relative to the camera image
+        """
+        if self._points is None or len(self._points) < BoxTrack.MIN_POINTS:
+            self._points = self._find_points(prev_gray, scale)
+            if self._points is None:
+                return
+
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, self._points, None,
+                                                         winSize=(15, 15), maxLevel=2)
+        is_tracked = status.reshape(-1) == 1
+        if np.count_nonzero(is_tracked) < BoxTrack.MIN_POINTS:
+            self._points = None
+            return
+
+        displacement = np.median((new_points - self._points).reshape(-1, 2)[is_tracked], axis=0) / scale
+        self.top_left += displacement
+        self.bottom_right += displacement
+        self._points = new_points[is_tracked].reshape(-1, 1, 2)
+
+    def get_prediction(self):
+        """
+        :return: a copy of the prediction with the tracked box.
+        """
+        prediction = ObjectDetectionPrediction(self.prediction.label, self.prediction.confidence,
+                                               tuple(int(v) for v in self.top_left),
+                                               tuple(int(v) for v in self.bottom_right))
+        prediction.image = self.prediction.image
+        prediction.pose_estimation = self.prediction.pose_estimation
+        prediction.frame_number = self.prediction.frame_number
+        return prediction
+
+    def _find_points(self, gray, scale):
+        height, width = gray.shape[:2]
+        x0, y0 = np.clip((self.top_left * scale).astype(int), 0, (width, height))
+        x1, y1 = np.clip((self.bottom_right * scale).astype(int), 0, (width, height))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+
+        mask = np.zeros(gray.shape[:2], np.uint8)
+        mask[y0:y1, x0:x1] = 255
+        return cv2.goodFeaturesToTrack(gray, BoxTrack.MAX_POINTS, 0.01, 5, mask=mask)
+
+
+class BoxTracker:
+    def __init__(self, history_size=32):
+        """
+        :param history_size: number of frames the boxes of new predictions can be moved forward from
+        """
+        self.history_size = history_size
+        self._history = collections.OrderedDict()
+        self._tracks = []
+        self._lock = threading.Lock()
+
+    def anchor(self, phys_obj_predictions):
+        """
+        Replace the tracked boxes of the object detectors in phys_obj_predictions with the new predictions.
+        :param phys_obj_predictions: a dictionary with the object detector names as keys and the predictions as values
+        :return: a dictionary with the object detector names as keys and the predictions with the boxes tracked
+        up to the latest frame as values. The object detectors in phys_obj_predictions without predictions
+        have empty lists.
+        """
+        with self._lock:
+            tracks = []
+            for track in self._tracks:
+                predictions = phys_obj_predictions.get(track.obj_detector_name)
+                # the predictions that are already tracked (e.g. reused while the scene is static) keep their track
+                if predictions is None or any(track.prediction is prediction for prediction in predictions):
+                    tracks.append(track)
+
+            for obj_detector_name, predictions in phys_obj_predictions.items():
+                if predictions is None:
+                    continue
+
+                for prediction in predictions:
+                    if any(track.prediction is prediction for track in tracks):
+                        continue
+
+                    track = BoxTrack(obj_detector_name, prediction)
+                    self._catch_up(track)
+                    tracks.append(track)
+
+            self._tracks = tracks
+            result = {obj_detector_name: [] for obj_detector_name in phys_obj_predictions}
+            result.update(self._get_predictions() or {})
+            return result
+
+    def update(self, camera_frame):
+        """
+        Move the tracked boxes to the camera frame.
+        :return: a dictionary with the object detector names as keys and the predictions with the tracked boxes
+        as values, None if there is nothing to track.
+        """
+        gray = camera_frame.half
+        with self._lock:
+            if len(self._history) > 0:
+                latest_frame_number, latest_gray = next(reversed(self._history.items()))
+                if camera_frame.frame_number <= latest_frame_number:
+                    return self._get_predictions()
+
+                if latest_gray.shape == gray.shape:
+                    for track in self._tracks:
+                        track.propagate(latest_gray, gray)
+                        track.frame_number = camera_frame.frame_number
+
+            self._history[camera_frame.frame_number] = gray
+            while len(self._history) > self.history_size:
+                self._history.popitem(last=False)
+
+            return self._get_predictions()
+
+    def reset(self):
+        with self._lock:
+            self._tracks = []
+            self._history.clear()
+
+    def _catch_up(self, track):
+        if track.frame_number not in self._history:
+            return
+
+        prev_gray = None
+        for frame_number, gray in self._history.items():
+            if frame_number < track.frame_number:
+                continue
+
+            if prev_gray is not None and prev_gray.shape == gray.shape:
+                track.propagate(prev_gray, gray)
+            track.frame_number = frame_number
+            prev_gray = gray
+
+    def _get_predictions(self):
+        if len(self._tracks) == 0:
+            return None
+
+        result = {}
+        for track in self._tracks:
+            result.setdefault(track.obj_detector_name, []).append(track.get_prediction())
+        return result
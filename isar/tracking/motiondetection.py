@@ -0,0 +1,92 @@
+import logging
+import time
+
+import cv2
+import numpy as np
+
+import isar
+
+logger = logging.getLogger("isar.motiondetection")
+
+
+"""
+Object detection (YOLO plus pose estimation) is expensive, but most of the time nothing on the table moves.
+The SceneChangeDetector compares the quarter resolution grayscale scene of a camera frame with the one of the
+last frame that objects were detected in. If nothing has changed the last predictions can be reused,
+otherwise only the changed region of the scene needs to be detected again.
+The object detectors respond at different times, so the detector keeps a reference frame for each of them.
+"""
+
+
+class SceneChangeDetector:
+    def __init__(self, diff_threshold=25, min_changed_fraction=0.001, max_region_fraction=0.5, margin=16,
+                 refresh_interval=isar.OBJECT_DETECTION_REFRESH_INTERVAL):
+        """
+        :param diff_threshold: min gray value difference of a changed pixel
+        :param min_changed_fraction: min fraction of changed pixels of the scene for the scene to be changed
+        :param max_region_fraction: if the changed region covers more than this fraction of the scene,
+        the whole scene is detected
+        :param margin: margin in quarter resolution pixels around the changed pixels,
+        so that objects that moved partially out of the changed pixels are completely in the region
+        :param refresh_interval: max time in sec between two detections of the whole scene
+        """
+        self.diff_threshold = diff_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_region_fraction = max_region_fraction
+        self.margin = margin
+        self.refresh_interval = refresh_interval
+
+        # the reference plane, the scene rect of the reference frame and the time of the last detection of the
+        # whole scene for each key (object detector name)
+        self._references = {}
+        self._reference_scene_rects = {}
+        self._refresh_times = {}
+
+    def get_changed_region(self, camera_frame, key=None):
+        """
+        :param key: the object detector the reference frame is for
+        :return: (is_changed, region). region is the changed rect (x, y, width, height) in raw image coordinates,
+        or None if the whole scene must be detected.
+        """
+        reference = self._references.get(key)
+        if reference is None or camera_frame.scene_rect != self._reference_scene_rects[key] \
+                or time.time() - self._refresh_times.get(key, 0) > self.refresh_interval:
+            return True, None
+
+        scene_quarter = camera_frame.get_scene_plane(camera_frame.quarter, 0.25)
+        if scene_quarter.shape != reference.shape:
+            return True, None
+
+        diff = cv2.absdiff(scene_quarter, reference)
+        _, changed = cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        changed = cv2.morphologyEx(changed, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        changed_points = cv2.findNonZero(changed)
+        if changed_points is None or len(changed_points) < self.min_changed_fraction * changed.size:
+            return False, None
+
+        x, y, width, height = cv2.boundingRect(changed_points)
+        x0, y0 = max(0, x - self.margin), max(0, y - self.margin)
+        x1 = min(changed.shape[1], x + width + self.margin)
+        y1 = min(changed.shape[0], y + height + self.margin)
+        if (x1 - x0) * (y1 - y0) > self.max_region_fraction * changed.size:
+            return True, None
+
+        scene_x, scene_y = (0, 0) if camera_frame.scene_rect is None else camera_frame.scene_rect[:2]
+        scene_x, scene_y = int(scene_x * 0.25) * 4, int(scene_y * 0.25) * 4
+        return True, (scene_x + 4 * x0, scene_y + 4 * y0, 4 * (x1 - x0), 4 * (y1 - y0))
+
+    def set_reference(self, camera_frame, key=None, is_whole_scene=True):
+        """
+        Set the frame that objects were detected in.
+        :param key: the object detector that detected the objects
+        :param is_whole_scene: the whole scene was detected (not only a changed region)
+        """
+        self._references[key] = camera_frame.get_scene_plane(camera_frame.quarter, 0.25).copy()
+        self._reference_scene_rects[key] = camera_frame.scene_rect
+        if is_whole_scene:
+            self._refresh_times[key] = time.time()
+
+    def reset(self):
+        self._references = {}
+        self._reference_scene_rects = {}
+        self._refresh_times = {}
@@ -9,10 +9,12 @@ import threading
 import time
 import traceback
 from queue import Queue
-from typing import List
 
 import isar
+from isar.camera.framepool import SharedFramePool
 from isar.services.service import Service
+from isar.tracking.motiondetection import SceneChangeDetector
+from isar.tracking.poseestimation import PoseEstimationPool
 
 logger = logging.getLogger("isar.objectdetection")
 
@@ -22,6 +24,12 @@ For each object detector we start a worker process with the detector as an attri
 Each worker process has a task and result queue. 
 When the service starts we start all teh object detector worker processes and join them. 
 When the service stops we terminate all the worker processes. 
+
+A single dispatcher thread sends each camera frame to all the worker processes in parallel and
+calls the callback once with the merged predictions of all the object detectors for that frame.
+
+The object detectors that estimate the poses of their predictions (they have a pose_estimator_module) share
+one pose estimation pool, each worker process gets a client of the pool.
 """
 
 OBJECT_DETECTORS_PATH = "./objectdetectors"
@@ -37,6 +45,12 @@ A dictionary with object detectors names as keys and the corresponding object de
 """
 object_detectors = {}
 
+"""
+A dictionary with physical object names (the labels of the predictions) as keys and the set of names of the
+object detectors that can detect the physical object as value.
+"""
+label_object_detectors = {}
+
 OBJECT_DETECTOR_MODULE_FILENAME = "objectdetector.py"
 OBJECT_DETECTOR_MODULE_NAME = "objectdetector"
 
@@ -45,7 +59,8 @@ POISON_PILL = "poison_pill"
 
 def init():
     """
-    Search the object detectors plugin directory and populate the object_detectors and physical_objects dictionaries
+    Search the object detectors plugin directory and populate the object_detectors, physical_objects and
+    label_object_detectors dictionaries
     :return:
     """
     global object_detectors
@@ -63,6 +78,8 @@ def init():
             if obj_detector.activate:
                 object_detectors[obj_detector.name] = obj_detector
                 physical_objects[obj_detector.name] = obj_detector.get_physical_objects()
+                for phys_obj in physical_objects[obj_detector.name]:
+                    label_object_detectors.setdefault(phys_obj.name, set()).add(obj_detector.name)
 
         except Exception as exp:
             logger.error("Could not load object detector module.")
@@ -90,35 +107,105 @@ def init():
     # and put in the response queue
 
 
+def get_object_detectors_names(scene_phys_objs_names):
+    """
+    :return: the set of names of the object detectors that can detect at least one of the scene physical objects.
+    """
+    global label_object_detectors
+    result = set()
+    for phys_obj_name in scene_phys_objs_names:
+        result.update(label_object_detectors.get(phys_obj_name, ()))
+    return result
+
+
 class ObjectDetectionService(Service):
     def __init__(self, service_name=None, camera_service=None):
         super().__init__(service_name)
         self.object_detector_workers = []
-        self.observer_threads: List[ObjectDetectionObserverThread] = []
+        self.dispatcher_thread = None
+        self.supervisor_thread = None
         self._camera_service = camera_service
         self._do_object_detection = False
+        self._frame_pool = None
+        self._pose_estimation_pool = None
 
     def start(self):
         """
         Start a process for each of the object detectors.
+        The camera frames are sent to the processes through a shared memory frame pool.
+        The dispatcher thread has at most one frame in its request queue and each worker has at most
+        max_pending_requests frames to detect.
         :return:
         """
         global object_detectors
+        # in throughput mode the object detectors get new frames while they are busy and run them as a batch
+        max_pending_requests = isar.OBJECT_DETECTION_BATCH_SIZE if isar.OBJECT_DETECTION_THROUGHPUT_MODE else 1
+        num_frame_slots = (max_pending_requests + 1) * len(object_detectors) + 1
+        self._frame_pool = SharedFramePool(num_frame_slots, self._camera_service.get_camera_capture_size())
+
+        pose_estimator_modules = {name: obj_detector.pose_estimator_module
+                                  for name, obj_detector in object_detectors.items()
+                                  if hasattr(obj_detector, "pose_estimator_module")}
+        if len(pose_estimator_modules) > 0:
+            self._pose_estimation_pool = PoseEstimationPool(pose_estimator_modules)
+            self._pose_estimation_pool.start()
+
         for obj_detector_name in object_detectors:
-            request_queue = mp.JoinableQueue(maxsize=1)
-            response_queue = mp.Queue()
-            obj_detector_worker = ObjectDetectorWorker(obj_detector_name, request_queue, response_queue)
-            # NOTE: object detection workers cannot be daemonic, becuase they may fork new child processes
-            self.object_detector_workers.append(obj_detector_worker)
-            observer_thread = ObjectDetectionObserverThread(Queue(maxsize=1), obj_detector_worker)
-            observer_thread.daemon = True
-            self.observer_threads.append(observer_thread)
+            self.object_detector_workers.append(self.create_worker(obj_detector_name))
 
+        # the workers warm up the object detectors in the background and set their ready event when done
         for worker in self.object_detector_workers:
             worker.start()
 
-        for observer_thread in self.observer_threads:
-            observer_thread.start()
+        change_detector = SceneChangeDetector() if isar.OBJECT_DETECTION_MOTION_GATING else None
+        self.dispatcher_thread = ObjectDetectionDispatcherThread(Queue(maxsize=1), self.object_detector_workers,
+                                                                 self._frame_pool, change_detector=change_detector,
+                                                                 max_pending_requests=max_pending_requests)
+        self.dispatcher_thread.daemon = True
+        self.dispatcher_thread.start()
+
+        self.supervisor_thread = ObjectDetectionSupervisorThread(self, self.dispatcher_thread,
+                                                                 use_standby_workers=isar.OBJECT_DETECTION_STANDBY_WORKERS,
+                                                                 pose_estimation_pool=self._pose_estimation_pool)
+        self.supervisor_thread.daemon = True
+        self.supervisor_thread.start()
+
+    def create_worker(self, obj_detector_name):
+        """
+        :return: a new (not started) worker process for the object detector
+        """
+        request_queue = mp.JoinableQueue(maxsize=isar.OBJECT_DETECTION_BATCH_SIZE)
+        response_queue = mp.Queue()
+        pose_estimation_client = None
+        if self._pose_estimation_pool is not None and \
+                obj_detector_name in self._pose_estimation_pool.clients_estimator_modules:
+            pose_estimation_client = self._pose_estimation_pool.get_client(obj_detector_name)
+        # NOTE: object detection workers cannot be daemonic, becuase they may fork new child processes
+        return ObjectDetectorWorker(obj_detector_name, request_queue, response_queue, self._frame_pool,
+                                    pose_estimation_client=pose_estimation_client)
+
+    def is_ready(self):
+        """
+        :return: True if all the object detectors are warmed up.
+        """
+        return all(worker.ready_event.is_set() for worker in self.object_detector_workers)
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Block until all the object detectors are warmed up.
+        :param timeout: max time in sec to wait, None to wait forever
+        :return: True if all the object detectors are ready.
+        """
+        end_time = None if timeout is None else time.time() + timeout
+        for worker in self.object_detector_workers:
+            remaining = None if end_time is None else max(0., end_time - time.time())
+            if not worker.ready_event.wait(remaining):
+                return False
+        return True
+
+    def get_ready_object_detectors_names(self):
+        return [worker.object_detector.name for worker in self.object_detector_workers
+                if worker.ready_event.is_set()]
 
     def start_object_detection(self):
         self._do_object_detection = True
@@ -127,6 +214,12 @@ class ObjectDetectionService(Service):
         self._do_object_detection = False
 
     def get_present_objects(self, camera_frame, scene_phys_objs_names, callback=None):
+        """
+        Request the detection of the scene physical objects in the camera frame. Returns immediately.
+        The frame is dropped if the previous frame is still waiting to be dispatched.
+        :param callback: called once with a dictionary with the object detector names as keys and their predictions
+        as values. Object detectors that were busy with a previous frame or missed the deadline are not in the dictionary.
+        """
         if not self._do_object_detection:
             logger.info("Object detection is deactivated. Return. Did you call start_object_detection() first?")
             return
@@ -134,22 +227,38 @@ class ObjectDetectionService(Service):
         if camera_frame is None:
             return
 
-        for observer_thread in self.observer_threads:
-            if not observer_thread.request_queue.full():
-                observer_thread.request_queue.put(ObjectDetectionRequest(camera_frame, scene_phys_objs_names), block=False)
-                observer_thread.callback = callback
+        if self.dispatcher_thread is None:
+            return
+
+        try:
+            self.dispatcher_thread.request_queue.put((camera_frame, scene_phys_objs_names, callback), block=False)
+        except queue.Full:
+            pass
+
+    def get_detection_latencies(self):
+        """
+        :return: a dictionary with the object detector names as keys and the smoothed time in sec
+        from the capture of a camera frame to the arrival of its predictions as values.
+        """
+        if self.dispatcher_thread is None:
+            return {}
+        return dict(self.dispatcher_thread.latencies)
 
     def stop(self):
-        for observer_thread in self.observer_threads:
-            if observer_thread.request_queue.empty():
-                observer_thread.request_queue.put(POISON_PILL)
-            else:
-                observer_thread.request_queue.get()
-                observer_thread.request_queue.task_done()
-                # observer_thread.request_queue.put(POISON_PILL)
-                # observer_thread.join(timeout=2)
-
-        for obj_detector_worker in self.object_detector_workers:
+        standby_workers = []
+        if self.supervisor_thread is not None:
+            self.supervisor_thread.stop_event.set()
+            self.supervisor_thread.join(timeout=2)
+            standby_workers = self.supervisor_thread.get_standby_workers()
+
+        if self.dispatcher_thread is not None:
+            try:
+                self.dispatcher_thread.request_queue.get(block=False)
+            except queue.Empty:
+                pass
+            self.dispatcher_thread.request_queue.put(POISON_PILL)
+
+        for obj_detector_worker in self.object_detector_workers + standby_workers:
             obj_detector_worker.request_queue.cancel_join_thread()
             obj_detector_worker.response_queue.cancel_join_thread()
             obj_detector_worker.shut_down()
@@ -170,6 +279,12 @@ class ObjectDetectionService(Service):
 
             obj_detector_worker.terminate()
 
+        if self._pose_estimation_pool is not None:
+            self._pose_estimation_pool.stop()
+
+        if self._frame_pool is not None:
+            self._frame_pool.close()
+
     @staticmethod
     def get_physical_objects():
         """
@@ -180,39 +295,383 @@ class ObjectDetectionService(Service):
         return physical_objects
 
 
-class ObjectDetectionObserverThread(threading.Thread):
-    def __init__(self, request_queue, obj_detector_worker, callback=None):
+class ObjectDetectionDispatcherThread(threading.Thread):
+    """
+    Sends each camera frame to the idle object detector workers that can detect at least one of the scene
+    physical objects in parallel and gathers their responses
+    until all of them have responded or the deadline has passed.
+    Then the callback is called once with the merged predictions for the frame.
+
+    A worker that misses the deadline stays busy until its late responses arrive, it gets new frames only while
+    it has less than max_pending_requests requests without response. The worker runs the requests that are waiting
+    in its queue as one batch.
+    The dispatcher does not wait for late responses, they are applied with the next frame, so that an object detector
+    that is slower than the deadline still updates the scene.
+    A response for a frame that is not newer than the last applied frame of its object detector is discarded too,
+    so that a slow round trip never overwrites fresher predictions.
+
+    With a change detector, the last predictions are returned without detection while the scene does not change.
+    If only a region of the scene has changed, only the region is detected, and the new predictions replace
+    the last predictions in the region. The change detector has a reference frame for each object detector, the frame
+    of its last applied response, so that a busy object detector does not turn off the motion gating of the others.
+    """
+    def __init__(self, request_queue, obj_detector_workers, frame_pool, deadline=isar.OBJECT_DETECTION_DEADLINE,
+                 change_detector=None, max_pending_requests=1):
+        """
+        :param request_queue: queue of (camera_frame, scene_phys_objs_names, callback)
+        :param deadline: max time in sec to wait for the responses to a frame
+        :param change_detector: a SceneChangeDetector, None to detect every frame
+        :param max_pending_requests: max number of requests without response of a worker
+        """
         super().__init__()
         self.request_queue = request_queue
-        self.obj_detector_worker = obj_detector_worker
-        self.callback = callback
+        self.obj_detector_workers = obj_detector_workers
+        self.frame_pool = frame_pool
+        self.deadline = deadline
+        self.latencies = {}
+        self.num_stale_responses = 0
+        self.change_detector = change_detector
+        self.max_pending_requests = max_pending_requests
+        self._last_applied_frame_numbers = {}
+        # the PendingRequests of each worker, in the order of the requests
+        self._pending_requests = {}
+        self._workers_lock = threading.Lock()
+        self._cached_predictions = {}
+        self._cached_scene_phys_objs_names = None
 
     def run(self):
-        self.wait_for_object_detection()
-
-    def wait_for_object_detection(self):
         while True:
             obj_detection_req = self.request_queue.get()
             if obj_detection_req == POISON_PILL:
-                self.request_queue.task_done()
                 break
 
-            phys_obj_predictions = {}
-            self.obj_detector_worker.request_queue.put(obj_detection_req)
-            obj_detection_response = self.obj_detector_worker.response_queue.get()
-            if obj_detection_response == POISON_PILL:
+            camera_frame, scene_phys_objs_names, callback = obj_detection_req
+            try:
+                with self._workers_lock:
+                    phys_obj_predictions = self.dispatch(camera_frame, scene_phys_objs_names)
+            except Exception as exp:
+                logger.error("Error in dispatching object detection request.")
+                logger.error(exp)
+                traceback.print_tb(exp.__traceback__)
+                continue
+
+            # the callback is called with empty predictions too, so that objects that are gone get cleared
+            if callback is not None:
+                try:
+                    callback(phys_obj_predictions)
+                except Exception as exp:
+                    logger.error("Error in calling object detection callback.")
+                    logger.error(exp)
+                    traceback.print_tb(exp.__traceback__)
+
+    def dispatch(self, camera_frame, scene_phys_objs_names):
+        """
+        :return: a dictionary with the names of the object detectors that responded before the deadline as keys
+        and their predictions as values. The object detectors that can not detect any object of the scene have
+        empty predictions, so that their objects of a previous scene are cleared.
+        """
+        # only the object detectors that can detect an object of the scene get the frame
+        obj_detectors_names = get_object_detectors_names(scene_phys_objs_names)
+        phys_obj_predictions = {}
+        for worker in self.obj_detector_workers:
+            if worker.object_detector.name not in obj_detectors_names:
+                phys_obj_predictions[worker.object_detector.name] = []
+                self._cached_predictions.pop(worker.object_detector.name, None)
+        phys_obj_predictions.update(self._apply_late_responses())
+
+        if self.change_detector is not None and set(scene_phys_objs_names) != self._cached_scene_phys_objs_names:
+            self._cached_scene_phys_objs_names = set(scene_phys_objs_names)
+            self._cached_predictions = {}
+            self.change_detector.reset()
+
+        # the idle workers grouped by the region of the frame they have to detect, None for the whole scene
+        regions_workers = {}
+        for worker in self.obj_detector_workers:
+            obj_detector_name = worker.object_detector.name
+            if obj_detector_name not in obj_detectors_names or not worker.ready_event.is_set() or \
+                    len(self._pending_requests.get(worker, ())) >= self.max_pending_requests:
+                continue
+
+            region = None
+            if self.change_detector is not None and obj_detector_name in self._cached_predictions:
+                is_changed, region = self.change_detector.get_changed_region(camera_frame, obj_detector_name)
+                if not is_changed:
+                    phys_obj_predictions[obj_detector_name] = self._cached_predictions[obj_detector_name]
+                    continue
+            regions_workers.setdefault(region, []).append(worker)
+
+        for region, workers in regions_workers.items():
+            self._send_requests(workers, camera_frame, scene_phys_objs_names, region)
+
+        deadline_time = time.time() + self.deadline
+        for workers in regions_workers.values():
+            for worker in workers:
+                predictions = self._apply_responses(worker, self._receive_responses(worker, deadline_time))
+                if predictions is not None:
+                    phys_obj_predictions[worker.object_detector.name] = predictions
+
+        return phys_obj_predictions
+
+    def _send_requests(self, workers, camera_frame, scene_phys_objs_names, region):
+        """
+        :param region: the changed region of the scene in raw image coordinates, None for the whole scene
+        """
+        if region is None:
+            image, offset = camera_frame.scene_view, camera_frame.scene_offset
+        else:
+            x, y, width, height = region
+            image = camera_frame.raw_image[y:y + height, x:x + width]
+            offset = (camera_frame.offset[0] + x, camera_frame.offset[1] + y)
+            region = (offset[0], offset[1], image.shape[1], image.shape[0])
+
+        # the crop is copied once in the shared memory and released by each of the workers
+        frame_handle = self.frame_pool.put(camera_frame, num_readers=len(workers), image=image, offset=offset)
+        if frame_handle is None:
+            return
+
+        for worker in workers:
+            worker.request_queue.put(ObjectDetectionRequest(frame_handle, scene_phys_objs_names, region))
+            self._pending_requests.setdefault(worker, []).append(PendingRequest(frame_handle, region, camera_frame))
+
+    def _receive_responses(self, worker, deadline_time=None):
+        """
+        Receive the responses of the worker until it has responded to all its pending requests or the deadline
+        has passed.
+        :param deadline_time: None to take only the responses that have already arrived
+        :return: the list of (response, PendingRequest) in the order of the requests
+        """
+        result = []
+        pending_requests = self._pending_requests.get(worker, [])
+        while len(pending_requests) > 0:
+            try:
+                if deadline_time is None:
+                    obj_detection_response = worker.response_queue.get(block=False)
+                else:
+                    obj_detection_response = worker.response_queue.get(timeout=max(0., deadline_time - time.time()))
+            except queue.Empty:
+                if deadline_time is not None:
+                    logger.debug("{} missed the object detection deadline.".format(worker.object_detector.name))
                 break
 
-            phys_obj_predictions[obj_detection_response.object_detector_name] = obj_detection_response.predictions
-            if self.callback is not None:
+            # the responses arrive in the order of the requests
+            pending_request = pending_requests.pop(0)
+            if obj_detection_response == isar.POISON_PILL:
+                break
+
+            self._update_latency(obj_detection_response)
+            result.append((obj_detection_response, pending_request))
+        return result
+
+    def _apply_late_responses(self):
+        """
+        :return: a dictionary with the names of the object detectors whose late responses have arrived
+        (and are not stale) as keys and their predictions as values.
+        """
+        result = {}
+        for worker in list(self._pending_requests):
+            if len(self._pending_requests[worker]) == 0:
+                continue
+
+            predictions = self._apply_responses(worker, self._receive_responses(worker))
+            if predictions is not None:
+                logger.debug("Applied late responses of {}.".format(worker.object_detector.name))
+                result[worker.object_detector.name] = predictions
+        return result
+
+    def _apply_responses(self, worker, responses):
+        """
+        Replace the cached predictions of the object detector of the worker with the predictions of each of the
+        responses in turn (only in the region of its request, if it has one).
+        The frame of the response is the reference of the change detector for the object detector.
+        :param responses: the list of (response, PendingRequest) from _receive_responses()
+        :return: the new predictions of the object detector, None if there are no responses or all are stale.
+        """
+        obj_detector_name = worker.object_detector.name
+        result = None
+        for obj_detection_response, pending_request in responses:
+            if self._is_stale(obj_detector_name, obj_detection_response.frame_number):
+                continue
+
+            predictions = list(obj_detection_response.predictions or ())
+            for prediction in predictions:
+                prediction.frame_number = obj_detection_response.frame_number
+
+            if pending_request.region is not None:
+                predictions = merge_region_predictions(self._cached_predictions.get(obj_detector_name),
+                                                       predictions, pending_request.region)
+            self._last_applied_frame_numbers[obj_detector_name] = obj_detection_response.frame_number
+            self._cached_predictions[obj_detector_name] = predictions
+            if self.change_detector is not None:
+                self.change_detector.set_reference(pending_request.camera_frame, obj_detector_name,
+                                                   is_whole_scene=pending_request.region is None)
+            result = predictions
+        return result
+
+    def get_pending_time(self, worker):
+        """
+        :return: the time in sec since the worker got the oldest request it has not responded to yet,
+        0 if there are none.
+        """
+        pending_requests = self._pending_requests.get(worker, ())
+        if len(pending_requests) == 0:
+            return 0.
+        return time.time() - pending_requests[0].dispatch_time
+
+    def replace_worker(self, worker, new_worker):
+        """
+        Replace a failed worker. The frame pool slots of its pending requests are released.
+        """
+        with self._workers_lock:
+            index = self.obj_detector_workers.index(worker)
+            self.obj_detector_workers[index] = new_worker
+            for pending_request in self._pending_requests.pop(worker, ()):
+                self.frame_pool.release(pending_request.frame_handle)
+
+    def _is_stale(self, obj_detector_name, frame_number):
+        last_frame_number = self._last_applied_frame_numbers.get(obj_detector_name, -1)
+        if frame_number > last_frame_number:
+            return False
+
+        self.num_stale_responses += 1
+        logger.debug("Discarded stale response of {} for frame {}. Last applied frame: {}".format(
+            obj_detector_name, frame_number, last_frame_number))
+        return True
+
+    def _update_latency(self, obj_detection_response, smoothing=0.2):
+        if obj_detection_response.capture_timestamp is None:
+            return
+
+        latency = time.time() - obj_detection_response.capture_timestamp
+        obj_detector_name = obj_detection_response.object_detector_name
+        if obj_detector_name in self.latencies:
+            latency = (1 - smoothing) * self.latencies[obj_detector_name] + smoothing * latency
+        self.latencies[obj_detector_name] = latency
+
+
+class PendingRequest:
+    def __init__(self, frame_handle, region, camera_frame):
+        """
+        A request of the dispatcher that the worker has not responded to yet.
+        :param region: the region of the request in camera coordinates, None for the whole scene
+        :param camera_frame: the camera frame of the request, the reference of the change detector once the
+        response is applied
+        """
+        self.frame_handle = frame_handle
+        self.region = region
+        self.camera_frame = camera_frame
+        self.dispatch_time = time.time()
+
+
+class ObjectDetectionSupervisorThread(threading.Thread):
+    """
+    Restarts the object detector workers that died, hang in the warm up or on a request, or stopped sending
+    heartbeats.
+    Consecutive restarts of the same object detector are delayed with an exponential backoff.
+    With standby workers, a warmed-up standby worker replaces the failed one, and a new standby worker is started.
+    The processes of the pose estimation pool that died are restarted too.
+    """
+    def __init__(self, obj_detection_service, dispatcher_thread, use_standby_workers=False, interval=1.,
+                 pose_estimation_pool=None):
+        super().__init__()
+        self.obj_detection_service = obj_detection_service
+        self.dispatcher_thread = dispatcher_thread
+        self.use_standby_workers = use_standby_workers
+        self.interval = interval
+        self.pose_estimation_pool = pose_estimation_pool
+        self.stop_event = threading.Event()
+        self._num_failures = {}
+        self._next_restart_times = {}
+        self._start_times = {}
+        self._standby_workers = {}
+
+    def run(self):
+        for worker in list(self.dispatcher_thread.obj_detector_workers):
+            self._start_times[worker.object_detector.name] = time.time()
+            if self.use_standby_workers:
+                self._start_standby_worker(worker.object_detector.name)
+
+        while not self.stop_event.wait(self.interval):
+            for worker in list(self.dispatcher_thread.obj_detector_workers):
                 try:
-                    self.callback(phys_obj_predictions)
+                    self.supervise(worker)
                 except Exception as exp:
-                    logger.error("Error in calling object detection callback.")
+                    logger.error("Error in supervising {}".format(worker.object_detector.name))
+                    logger.error(exp)
+                    traceback.print_tb(exp.__traceback__)
+
+            if self.pose_estimation_pool is not None:
+                try:
+                    self.pose_estimation_pool.restart_dead_processes()
+                except Exception as exp:
+                    logger.error("Error in supervising the pose estimation pool")
                     logger.error(exp)
                     traceback.print_tb(exp.__traceback__)
 
-            self.request_queue.task_done()
+    def supervise(self, worker):
+        obj_detector_name = worker.object_detector.name
+        failure = self.get_failure(worker)
+        if failure is None:
+            if time.time() - self._start_times[obj_detector_name] > isar.OBJECT_DETECTION_RESTART_BACKOFF_MAX:
+                self._num_failures[obj_detector_name] = 0
+            return
+
+        if time.time() < self._next_restart_times.get(obj_detector_name, 0):
+            return
+
+        num_failures = self._num_failures.get(obj_detector_name, 0)
+        logger.error("{} {}. Restart it.".format(obj_detector_name, failure))
+        self._num_failures[obj_detector_name] = num_failures + 1
+        backoff = min(isar.OBJECT_DETECTION_RESTART_BACKOFF_MAX,
+                      isar.OBJECT_DETECTION_RESTART_BACKOFF_MIN * 2 ** num_failures)
+        self._next_restart_times[obj_detector_name] = time.time() + backoff
+
+        new_worker = self._standby_workers.pop(obj_detector_name, None)
+        if new_worker is None or not new_worker.is_alive():
+            new_worker = self.obj_detection_service.create_worker(obj_detector_name)
+            new_worker.start()
+
+        self.dispatcher_thread.replace_worker(worker, new_worker)
+        self._start_times[obj_detector_name] = time.time()
+        self._kill_worker(worker)
+
+        if self.use_standby_workers:
+            self._start_standby_worker(obj_detector_name)
+
+    def get_failure(self, worker):
+        """
+        :return: the description of the failure of the worker, None if it is healthy.
+        """
+        if not worker.is_alive():
+            return "died with exit code {}".format(worker.exitcode)
+
+        # the worker sends heartbeats only after the warm up
+        if not worker.ready_event.is_set():
+            if time.time() - self._start_times[worker.object_detector.name] > isar.OBJECT_DETECTION_WARM_UP_TIMEOUT:
+                return "did not warm up within {} sec".format(isar.OBJECT_DETECTION_WARM_UP_TIMEOUT)
+            return None
+
+        if time.time() - worker.heartbeat.value > isar.OBJECT_DETECTION_HEARTBEAT_TIMEOUT:
+            return "sent no heartbeat for {} sec".format(isar.OBJECT_DETECTION_HEARTBEAT_TIMEOUT)
+
+        if self.dispatcher_thread.get_pending_time(worker) > isar.OBJECT_DETECTION_REQUEST_TIMEOUT:
+            return "did not respond to a request within {} sec".format(isar.OBJECT_DETECTION_REQUEST_TIMEOUT)
+
+        return None
+
+    def get_standby_workers(self):
+        return list(self._standby_workers.values())
+
+    def _start_standby_worker(self, obj_detector_name):
+        standby_worker = self.obj_detection_service.create_worker(obj_detector_name)
+        standby_worker.start()
+        self._standby_workers[obj_detector_name] = standby_worker
+
+    @staticmethod
+    def _kill_worker(worker):
+        worker.terminate()
+        worker.join(timeout=1)
+        if worker.is_alive():
+            worker.kill()
 
 
 class ObjectDetectionPrediction:
@@ -223,6 +682,7 @@ class ObjectDetectionPrediction:
         self.bottom_right = bottom_right
         self.image = None
         self.pose_estimation = None
+        self.frame_number = None   # the number of the camera frame the prediction was made on
 
     @property
     def top_left(self):
@@ -241,28 +701,99 @@ class ObjectDetectionPrediction:
         self._bottom_right = (value[0], value[1])
 
 
+def merge_region_predictions(predictions, region_predictions, region):
+    """
+    :param predictions: the predictions for the whole scene
+    :param region_predictions: the predictions for a region of the scene
+    :param region: (x, y, width, height) in camera coordinates
+    :return: the predictions with the center outside of the region plus the region predictions
+    """
+    result = []
+    if predictions is not None:
+        for prediction in predictions:
+            if not is_in_region(get_prediction_center(prediction), region):
+                result.append(prediction)
+
+    if region_predictions is not None:
+        result.extend(region_predictions)
+    return result
+
+
+def get_prediction_center(prediction):
+    return ((prediction.top_left[0] + prediction.bottom_right[0]) / 2,
+            (prediction.top_left[1] + prediction.bottom_right[1]) / 2)
+
+
+def is_in_region(point, region):
+    """
+    :param region: (x, y, width, height) in camera coordinates, None for the whole scene
+    """
+    if region is None:
+        return True
+
+    x, y, width, height = region
+    return x <= point[0] < x + width and y <= point[1] < y + height
+
+
 class ObjectDetectionRequest:
-    def __init__(self, camera_frame, scene_phys_objs_names):
-        self.camera_frame = camera_frame
+    def __init__(self, frame_handle, scene_phys_objs_names, region=None):
+        """
+        :param frame_handle: the SharedFrameHandle of the camera frame.
+        The ObjectDetectorWorker sets the camera_frame from it before calling the object detector.
+        :param region: the changed region (x, y, width, height) of the scene in camera coordinates that the
+        camera frame is cropped to, None if the camera frame is the whole scene
+        """
+        self.frame_handle = frame_handle
+        self.frame_number = frame_handle.frame_number
+        self.capture_timestamp = frame_handle.timestamp
+        self.camera_frame = None
         self.scene_physical_objects_names = scene_phys_objs_names
+        self.region = region
 
 
 class ObjectDetectionResponse:
-    def __init__(self, obj_detector_name, predictions):
+    def __init__(self, obj_detector_name, predictions, frame_number=-1, capture_timestamp=None):
+        """
+        :param frame_number: the number of the camera frame the predictions were made on
+        :param capture_timestamp: the capture time of the camera frame
+        """
         self.object_detector_name = obj_detector_name
         self.predictions = predictions
+        self.frame_number = frame_number
+        self.capture_timestamp = capture_timestamp
 
 
 class ObjectDetectorWorker(mp.Process):
-    def __init__(self, object_detector_name, request_queue, response_queue):
+    """
+    Warms up the object detector (if it has warm_up()) and sets the ready event, then
+    runs the object detector on the requests. The requests that are already in the queue (up to batch_size)
+    are run as one batch if the object detector has get_predictions_batch(), the worker does not wait for more.
+    There is one response per request. The worker sets its heartbeat each time it polls the request queue and after
+    each batch.
+    """
+    def __init__(self, object_detector_name, request_queue, response_queue, frame_pool,
+                 batch_size=isar.OBJECT_DETECTION_BATCH_SIZE, pose_estimation_client=None):
+        """
+        :param pose_estimation_client: the client of the pose estimation pool for the object detector
+        """
         mp.Process.__init__(self)
         self.object_detector = object_detectors[object_detector_name]
         self.request_queue = request_queue
         self.response_queue = response_queue
+        self.frame_pool = frame_pool
+        self.pose_estimation_client = pose_estimation_client
+        self.batch_size = batch_size
         self.stop_event = mp.Event()
+        self.ready_event = mp.Event()
+        self.heartbeat = mp.Value("d", time.time())
 
     def run(self):
+        if self.pose_estimation_client is not None:
+            self.object_detector.pose_estimation_client = self.pose_estimation_client
+        self.warm_up()
         while True:
+            # the heartbeat is sent from the request loop, so that it stops when the loop hangs
+            self.heartbeat.value = time.time()
             if self.stop_event.is_set():
                 if not self.request_queue.empty():
                     self.request_queue.get()
@@ -270,16 +801,82 @@ class ObjectDetectorWorker(mp.Process):
                 logger.info("{} stop event is set. sys.exit()".format(self))
                 sys.exit(0)
 
-            obj_detection_request = self.request_queue.get()
+            try:
+                obj_detection_request = self.request_queue.get(timeout=isar.OBJECT_DETECTION_HEARTBEAT_TIMEOUT / 5)
+            except queue.Empty:
+                continue
+
             if obj_detection_request == isar.POISON_PILL:
                 logger.info("{} received poison pill. sys.exit()".format(self))
                 sys.exit(0)
 
+            obj_detection_requests, received_poison_pill = self.get_batch(obj_detection_request)
+
             t1 = time.time()
-            obj_detection_predictions = self.object_detector.get_predictions(obj_detection_request)
-            self.request_queue.task_done()
-            self.response_queue.put(ObjectDetectionResponse(self.object_detector.name, obj_detection_predictions))
-            logger.debug("Detection of objects by {} took {}".format(self.object_detector.name, time.time() - t1))
+            for obj_detection_request in obj_detection_requests:
+                obj_detection_request.camera_frame = self.frame_pool.get(obj_detection_request.frame_handle)
+            try:
+                predictions_batch = self.get_predictions(obj_detection_requests)
+            finally:
+                # the predictions hold copies of the cropped images, not views on the shared memory
+                for obj_detection_request in obj_detection_requests:
+                    obj_detection_request.camera_frame = None
+                    self.frame_pool.release(obj_detection_request.frame_handle)
+
+            for obj_detection_request, obj_detection_predictions in zip(obj_detection_requests, predictions_batch):
+                self.request_queue.task_done()
+                self.response_queue.put(ObjectDetectionResponse(self.object_detector.name, obj_detection_predictions,
+                                                                obj_detection_request.frame_number,
+                                                                obj_detection_request.capture_timestamp))
+            logger.debug("Detection of objects by {} in {} frames took {}".format(
+                self.object_detector.name, len(obj_detection_requests), time.time() - t1))
+
+            if received_poison_pill:
+                logger.info("{} received poison pill. sys.exit()".format(self))
+                sys.exit(0)
+
+    def warm_up(self):
+        t1 = time.time()
+        if hasattr(self.object_detector, "warm_up"):
+            try:
+                self.object_detector.warm_up()
+            except Exception as exp:
+                logger.error("Error in warming up {}".format(self.object_detector.name))
+                logger.error(exp)
+                traceback.print_tb(exp.__traceback__)
+
+        self.heartbeat.value = time.time()
+        self.ready_event.set()
+        logger.info("{} is ready. Warm up took {}".format(self.object_detector.name, time.time() - t1))
+
+    def get_batch(self, obj_detection_request):
+        """
+        :return: the list of the request and the requests that are already in the queue,
+        and whether a poison pill was received.
+        """
+        obj_detection_requests = [obj_detection_request]
+        while len(obj_detection_requests) < self.batch_size:
+            try:
+                obj_detection_request = self.request_queue.get(block=False)
+            except queue.Empty:
+                break
+
+            if obj_detection_request == isar.POISON_PILL:
+                return obj_detection_requests, True
+
+            obj_detection_requests.append(obj_detection_request)
+
+        return obj_detection_requests, False
+
+    def get_predictions(self, obj_detection_requests):
+        """
+        :return: the list of predictions for each request
+        """
+        if len(obj_detection_requests) > 1 and hasattr(self.object_detector, "get_predictions_batch"):
+            return self.object_detector.get_predictions_batch(obj_detection_requests)
+
+        return [self.object_detector.get_predictions(obj_detection_request)
+                for obj_detection_request in obj_detection_requests]
 
     def shut_down(self):
         logger.info("Shutting down: {}".format(self.object_detector.name))
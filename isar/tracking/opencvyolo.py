@@ -0,0 +1,106 @@
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("isar.opencvyolo")
+
+
+"""
+CPU inference of darknet YOLO models with the OpenCV DNN module.
+It is a lighter alternative to darkflow's TFNet: no TensorFlow in the object detector worker processes.
+The predictions have the same format as TFNet.return_predict(), so the object detectors can use both backends.
+"""
+
+
+def read_input_size(cfg_path):
+    """
+    :return: the (width, height) of the network input from the [net] section of a darknet cfg file.
+    """
+    width, height = 416, 416
+    with open(cfg_path) as f:
+        for line in f:
+            line = line.split("#")[0].replace(" ", "").strip()
+            if line.startswith("[") and line != "[net]":
+                break
+            if line.startswith("width="):
+                width = int(line[len("width="):])
+            elif line.startswith("height="):
+                height = int(line[len("height="):])
+    return width, height
+
+
+class OpenCVYolo:
+    def __init__(self, cfg_path, weights_path, labels_path, threshold=0.5, nms_threshold=0.3):
+        """
+        :param threshold: min confidence of a prediction
+        :param nms_threshold: max overlap (IoU) of two predictions in the non-maximum suppression
+        """
+        self.threshold = threshold
+        self.nms_threshold = nms_threshold
+        self.input_size = read_input_size(cfg_path)
+        with open(labels_path) as f:
+            self.labels = [label.strip() for label in f.read().strip().split("\n")]
+
+        self.net = cv2.dnn.readNetFromDarknet(cfg_path, weights_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.output_layer_names = self.net.getUnconnectedOutLayersNames()
+
+    def return_predict(self, image):
+        """
+        :return: a list of dictionaries with label, confidence, topleft and bottomright (like darkflow TFNet).
+        """
+        return self.return_predict_batch([image])[0]
+
+    def return_predict_batch(self, images):
+        """
+        Run the network once for a batch of images.
+        :return: the list of predictions for each image.
+        """
+        blob = cv2.dnn.blobFromImages(images, 1 / 255.0, self.input_size, swapRB=True, crop=False)
+        self.net.setInput(blob)
+        outputs = self.net.forward(self.output_layer_names)
+
+        # the detections of all the images of the batch are stacked in each output
+        outputs = [output.reshape(len(images), -1, output.shape[-1]) for output in outputs]
+        return [self._get_predictions([output[i] for output in outputs], image)
+                for i, image in enumerate(images)]
+
+    def _get_predictions(self, outputs, image):
+        height, width = image.shape[:2]
+        detections = np.concatenate(outputs, axis=0)
+        scores = detections[:, 5:]
+        class_ids = np.argmax(scores, axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        is_confident = confidences > self.threshold
+        if not np.any(is_confident):
+            return []
+
+        # center x, center y, width, height relative to the image size
+        rel_boxes = detections[is_confident, :4]
+        class_ids = class_ids[is_confident]
+        confidences = confidences[is_confident]
+        boxes = np.column_stack(((rel_boxes[:, 0] - rel_boxes[:, 2] / 2) * width,
+                                 (rel_boxes[:, 1] - rel_boxes[:, 3] / 2) * height,
+                                 rel_boxes[:, 2] * width,
+                                 rel_boxes[:, 3] * height)).astype(int)
+
+        # non-maximum suppression per class like darkflow, overlapping objects of different classes are kept
+        indices = []
+        for class_id in np.unique(class_ids):
+            class_indices = np.flatnonzero(class_ids == class_id)
+            kept = cv2.dnn.NMSBoxes(boxes[class_indices].tolist(), confidences[class_indices].tolist(),
+                                    self.threshold, self.nms_threshold)
+            indices.extend(class_indices[np.array(kept, dtype=int).reshape(-1)])
+
+        predictions = []
+        for i in sorted(indices, key=lambda i: -confidences[i]):
+            x, y, box_width, box_height = boxes[i]
+            predictions.append({
+                "label": self.labels[class_ids[i]],
+                "confidence": float(confidences[i]),
+                "topleft": {"x": int(max(0, x)), "y": int(max(0, y))},
+                "bottomright": {"x": int(min(width - 1, x + box_width)), "y": int(min(height - 1, y + box_height))}
+            })
+        return predictions
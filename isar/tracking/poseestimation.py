@@ -0,0 +1,253 @@
+import importlib
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+import traceback
+
+import isar
+
+logger = logging.getLogger("isar.poseestimation")
+
+
+"""
+The object detectors estimate the poses of their predictions in pose estimator processes.
+Each pose estimation request has an id and a deadline and is answered through a PoseEstimationFuture.
+The PoseEstimationClient collects exactly the results of the requests it waits for, until their deadline.
+Results that arrive after the deadline are discarded, the pose estimators skip requests whose deadline has passed.
+
+All the object detectors share one PoseEstimationPool, owned by the ObjectDetectionService and sized to the
+number of CPU cores. Each object detector has its own result queue in the pool. A pose estimation request names the
+module of the PoseEstimator of the object detector, the pool processes create one PoseEstimator per module.
+"""
+
+
+class PoseEstimationTask:
+    def __init__(self, request_id, deadline, pe_input, client_name, estimator_module):
+        """
+        :param deadline: the time.time() after which the result is not needed anymore
+        :param pe_input: the PoseEstimationInput of the object detector
+        :param client_name: the name of the result queue of the pool to put the result in
+        :param estimator_module: the name of the module with the PoseEstimator class of the object detector
+        """
+        self.request_id = request_id
+        self.deadline = deadline
+        self.pe_input = pe_input
+        self.client_name = client_name
+        self.estimator_module = estimator_module
+
+
+class PoseEstimationResult:
+    def __init__(self, request_id, pe_output):
+        self.request_id = request_id
+        self.pe_output = pe_output
+
+
+class PoseEstimationFuture:
+    def __init__(self, request_id, deadline):
+        self.request_id = request_id
+        self.deadline = deadline
+        self._pe_output = None
+        self._is_done = False
+
+    def done(self):
+        return self._is_done
+
+    def set_result(self, pe_output):
+        self._pe_output = pe_output
+        self._is_done = True
+
+    def result(self):
+        """
+        :return: the PoseEstimationOutput, None if it did not arrive before the deadline
+        """
+        return self._pe_output
+
+
+class PoseEstimationClient:
+    def __init__(self, task_queue, result_queue, client_name, estimator_module, timeout=isar.POSE_ESTIMATION_DEADLINE):
+        """
+        :param timeout: the default time in sec from submitting a request to its deadline
+        """
+        self.task_queue = task_queue
+        self.result_queue = result_queue
+        self.client_name = client_name
+        self.estimator_module = estimator_module
+        self.timeout = timeout
+        self._request_ids = itertools.count()
+        self._pending_futures = {}
+
+    def submit(self, pe_input, timeout=None):
+        """
+        :return: a PoseEstimationFuture for the PoseEstimationOutput of pe_input
+        """
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        # a restarted object detector process gets the result queue of the old one, the pid tells their requests apart
+        future = PoseEstimationFuture((os.getpid(), next(self._request_ids)), deadline)
+        self._pending_futures[future.request_id] = future
+        self.task_queue.put(PoseEstimationTask(future.request_id, deadline, pe_input,
+                                               self.client_name, self.estimator_module))
+        return future
+
+    def wait(self, futures):
+        """
+        Wait until the futures are done or their deadlines have passed.
+        The futures that are not done are not pending anymore, their results are discarded when they arrive.
+        """
+        futures = list(futures)
+        while True:
+            waiting_futures = [future for future in futures if not future.done()]
+            if len(waiting_futures) == 0:
+                break
+
+            timeout = max(future.deadline for future in waiting_futures) - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                result = self.result_queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            future = self._pending_futures.pop(result.request_id, None)
+            if future is None or time.time() > future.deadline:
+                logger.debug("Discarded the late result of the pose estimation request {}".format(result.request_id))
+                continue
+
+            future.set_result(result.pe_output)
+
+        for future in futures:
+            if not future.done():
+                logger.debug("The pose estimation request {} missed its deadline.".format(future.request_id))
+            self._pending_futures.pop(future.request_id, None)
+
+
+class PoseEstimationPool:
+    def __init__(self, clients_estimator_modules, num_processes=isar.POSE_ESTIMATION_PROCESSES):
+        """
+        :param clients_estimator_modules: a dictionary with the object detectors names as keys and the names of
+        the modules of their PoseEstimator classes as values
+        :param num_processes: the number of pose estimator processes, None for the number of CPU cores
+        """
+        self.clients_estimator_modules = clients_estimator_modules
+        self.num_processes = num_processes if num_processes is not None else get_num_cpu_cores()
+        self._context, self._preloaded_modules = get_pool_context(set(clients_estimator_modules.values()))
+        self.task_queue = self._context.Queue()
+        self.result_queues = {client_name: self._context.Queue() for client_name in clients_estimator_modules}
+        self.processes = []
+
+    def start(self):
+        for i in range(self.num_processes):
+            self.processes.append(self._start_process(i))
+        logger.info("Started {} pose estimator processes.".format(self.num_processes))
+
+    def restart_dead_processes(self):
+        """
+        Replace the pose estimator processes that died. The requests they were working on miss their deadline.
+        """
+        for i, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+
+            logger.error("{} died with exit code {}. Restart it.".format(process.name, process.exitcode))
+            self.processes[i] = self._start_process(i)
+
+    def _start_process(self, index):
+        process = self._context.Process(name="PoseEstimator-{}".format(index), target=run_pose_estimator,
+                                        args=(self.task_queue, self.result_queues, isar.PLATFORM,
+                                              self._preloaded_modules))
+        process.daemon = True
+        process.start()
+        return process
+
+    def get_client(self, client_name):
+        """
+        :return: a new PoseEstimationClient for the object detector with the name client_name
+        """
+        return PoseEstimationClient(self.task_queue, self.result_queues[client_name],
+                                    client_name, self.clients_estimator_modules[client_name])
+
+    def stop(self):
+        for _ in self.processes:
+            self.task_queue.put(isar.POISON_PILL)
+
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+
+        self.task_queue.cancel_join_thread()
+        for result_queue in self.result_queues.values():
+            result_queue.cancel_join_thread()
+        self.processes = []
+
+
+def get_num_cpu_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_pool_context(estimator_modules):
+    """
+    :return: the forkserver multiprocessing context if the platform has it, the default context otherwise, and
+    the names of the modules the forkserver preloads.
+    The forkserver preloads cv2, numpy, this module and the pose estimator modules, so the pool processes start
+    fast and share their read-only pages. The forkserver ignores the modules it can not import, so the pose estimator
+    modules must be importable on their own (without isar.scene and PyQt5), run_pose_estimator logs the ones that
+    are missing.
+    """
+    if "forkserver" not in mp.get_all_start_methods():
+        return mp.get_context(), []
+
+    preloaded_modules = ["cv2", "numpy", __name__] + sorted(estimator_modules)
+    context = mp.get_context("forkserver")
+    context.set_forkserver_preload(preloaded_modules)
+    return context, preloaded_modules
+
+
+def check_preloaded_modules(preloaded_modules):
+    """
+    Log an error for each of the preloaded_modules that the forkserver could not import.
+    """
+    for module_name in preloaded_modules:
+        if module_name not in sys.modules:
+            logger.error("The forkserver could not preload {}, each pose estimator process imports it on its own. "
+                         "Check that it can be imported without isar.scene.".format(module_name))
+
+
+def run_pose_estimator(task_queue, result_queues, platform, preloaded_modules=()):
+    """
+    The main function of the pose estimator processes of the pool.
+    :param platform: isar.PLATFORM of the application, the forkserver processes do not inherit it
+    :param preloaded_modules: the names of the modules the forkserver should have preloaded
+    """
+    isar.PLATFORM = platform
+    check_preloaded_modules(preloaded_modules)
+    pose_estimators = {}
+    while True:
+        task = task_queue.get()
+        if task == isar.POISON_PILL:
+            logger.info("Pose estimator {} received poison pill.".format(os.getpid()))
+            return
+
+        if time.time() > task.deadline:
+            logger.debug("Skipped the pose estimation request {} after its deadline.".format(task.request_id))
+            continue
+
+        t1 = time.time()
+        pe_output = None
+        try:
+            if task.estimator_module not in pose_estimators:
+                pose_estimators[task.estimator_module] = importlib.import_module(task.estimator_module).PoseEstimator()
+            pe_output = pose_estimators[task.estimator_module].estimate_pose(task.pe_input)
+        except Exception as exp:
+            logger.error("Error in estimating the pose of {}".format(task.pe_input.object_name))
+            logger.error(exp)
+            traceback.print_tb(exp.__traceback__)
+
+        result_queues[task.client_name].put(PoseEstimationResult(task.request_id, pe_output))
+        logger.debug("Estimating the pose of {} took {}".format(task.pe_input.object_name, time.time() - t1))
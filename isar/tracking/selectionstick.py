@@ -8,6 +8,7 @@ import threading
 import numpy as np
 
 import isar
+from isar.camera.framepool import SharedFramePool
 from isar.events import eventmanager
 from isar.events.events import SelectionEvent
 from isar.scene import sceneutil
@@ -61,8 +62,11 @@ class SelectionStickService(Service):
         self.event_timers_annotation = {}
 
         self._camera_service = camera_service
+        self._camera_frames = camera_service.subscribe(str(service_name),
+                                                       rate=1 / isar.SELECTION_STICK_TRACKING_INTERVAL)
         self._rect_queue = Queue(1)
         self._cam_frame_queue = Queue(1)
+        self._frame_pool = None
 
         self.__current_rect = None
 
@@ -72,9 +76,16 @@ class SelectionStickService(Service):
     def start(self):
         self._camera_service.start_capture()
 
+        # one frame in the queue, one in the tracking process, one waiting to be put in the queue
+        num_frame_slots = 3
+        # the tracking process only gets the half resolution grayscale plane of the frames
+        self._frame_pool = SharedFramePool(num_frame_slots, self._camera_service.get_camera_capture_size(),
+                                           channels=1)
+
         tracking_process = SelectionStickTrackingProcess(self._rect_queue,
                                                          self._cam_frame_queue,
-                                                         self._stop_tracking_event)
+                                                         self._stop_tracking_event,
+                                                         self._frame_pool)
         tracking_process.name = "SelectionStickTrackingProcess"
         tracking_process.daemon = True
         tracking_process.start()
@@ -90,9 +101,22 @@ class SelectionStickService(Service):
 
     def _start_tracking(self, cam_frame_queue):
         while True:
-            time.sleep(isar.SELECTION_STICK_TRACKING_INTERVAL)
-            cam_frame = self._camera_service.get_frame()
-            cam_frame_queue.put(cam_frame)
+            cam_frame = self._camera_frames.get_frame(timeout=isar.CAMERA_FRAME_TIMEOUT)
+            if cam_frame is None:
+                continue
+
+            if cam_frame == isar.POISON_PILL:
+                cam_frame_queue.put(cam_frame)
+                break
+
+            frame_handle = self._frame_pool.put(cam_frame,
+                                                image=cam_frame.get_scene_plane(cam_frame.half, 0.5),
+                                                offset=cam_frame.scene_offset,
+                                                scale=0.5)
+            if frame_handle is None:
+                continue
+
+            cam_frame_queue.put(frame_handle)
 
     def _start_event_detection(self):
         # get the center of marker rect
@@ -192,6 +216,8 @@ class SelectionStickService(Service):
         self._stop_event_detection_event.set()
         self._cam_frame_queue.cancel_join_thread()
         self._rect_queue.cancel_join_thread()
+        if self._frame_pool is not None:
+            self._frame_pool.close()
 
     def fire_event(self, target):
         logger.info("Fire SelectionEvent on: " + str(target))
@@ -266,31 +292,34 @@ class SelectionStickService(Service):
 
 
 class SelectionStickTrackingProcess(Process):
-    def __init__(self, rect_queue, cam_frame_queue, stop_tracking_event):
+    def __init__(self, rect_queue, cam_frame_queue, stop_tracking_event, frame_pool):
         super().__init__()
         self.rect_queue = rect_queue
         self._cam_frame_queue = cam_frame_queue
+        self._frame_pool = frame_pool
         self._current_rect = None
         self._stop_tracking_event = stop_tracking_event
         self.MARKER_ID = 5
 
     def run(self):
         while not self._stop_tracking_event.is_set():
-            camera_frame = self._cam_frame_queue.get()
-            if camera_frame == isar.POISON_PILL:
+            frame_handle = self._cam_frame_queue.get()
+            if frame_handle == isar.POISON_PILL:
                 logger.info("SelectionStickTrackingProcess received POISON_PILL. Break.")
                 break
 
-            if camera_frame is None:
+            if frame_handle is None:
                 continue
 
-            camera_img = camera_frame.raw_image
-
-            if camera_img is None:
-                continue
+            # marker detection on the half resolution grayscale plane is much cheaper than on the full BGR frame
+            camera_frame = self._frame_pool.get(frame_handle)
+            try:
+                marker_corners, marker_ids, _ = cv2.aruco.detectMarkers(camera_frame.raw_image,
+                                                                        sceneutil.aruco_dictionary)
+            finally:
+                self._frame_pool.release(frame_handle)
 
             current_rect = None
-            marker_corners, marker_ids, _ = cv2.aruco.detectMarkers(camera_img, sceneutil.aruco_dictionary)
             if marker_ids is None:
                 current_rect = None
                 continue
@@ -301,7 +330,7 @@ class SelectionStickTrackingProcess(Process):
                     index = i
 
             if index != -1:
-                current_rect = marker_corners[index].reshape(4, 2)
+                current_rect = marker_corners[index].reshape(4, 2) / frame_handle.scale + frame_handle.offset
             else:
                 current_rect = None
 
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import os
+import traceback
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger("isar.templatefeatures")
+
+
+"""
+The AKAZE key points and descriptors of the template images of the physical objects do not change.
+They are computed once when the object detector package is loaded and stored in a directory next to the
+template images, together with a hash of the template image file and the feature parameters.
+They are recomputed only if the template image or the parameters change.
+
+The pose estimator processes keep the features of all templates in memory, keyed by the physical object name,
+so only the features of the cropped camera image are extracted for each pose estimation.
+"""
+
+AKAZE_THRESHOLD = 1e-4
+FEATURES_FILE_EXTENSION = ".npz"
+
+
+class TemplateFeatures:
+    """
+    The key points and descriptors of a template image at one scale.
+    The key points are stored as an array of (x, y, size, angle, response, octave, class_id),
+    because cv2.KeyPoint can not be pickled.
+    """
+    def __init__(self, key_points_array, descriptors):
+        self.key_points_array = key_points_array
+        self.descriptors = descriptors
+        self._key_points = None
+
+    @property
+    def key_points(self):
+        """
+        :return: the list of cv2.KeyPoint, created on first access (e.g. in the pose estimator process)
+        """
+        if self._key_points is None:
+            self._key_points = [cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response),
+                                             int(octave), int(class_id))
+                                for x, y, size, angle, response, octave, class_id in self.key_points_array]
+        return self._key_points
+
+    def __getstate__(self):
+        return {"key_points_array": self.key_points_array, "descriptors": self.descriptors}
+
+    def __setstate__(self, state):
+        self.__init__(state["key_points_array"], state["descriptors"])
+
+
+def compute_template_features(template_image, scale=1., akaze_threshold=AKAZE_THRESHOLD):
+    image = template_image
+    if scale != 1.:
+        image = cv2.resize(template_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+
+    feature_extractor = cv2.AKAZE_create(threshold=akaze_threshold)
+    key_points, descriptors = feature_extractor.detectAndCompute(image, None)
+    key_points_array = np.array([(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+                                 for kp in key_points], dtype=np.float32).reshape(-1, 7)
+    return TemplateFeatures(key_points_array, descriptors)
+
+
+def get_template_hash(template_image_path, scales, akaze_threshold):
+    sha1 = hashlib.sha1()
+    with open(template_image_path, "rb") as f:
+        sha1.update(f.read())
+    sha1.update(repr((tuple(scales), akaze_threshold)).encode())
+    return sha1.hexdigest()
+
+
+def load_template_features(template_image_files, template_images, features_path, scales=(1., 2.),
+                           akaze_threshold=AKAZE_THRESHOLD):
+    """
+    Load the features of the template images of the physical objects from features_path.
+    The features of new or changed template images are computed and saved in features_path.
+    :param template_image_files: a dictionary with physical object names as keys and the template image file paths
+    as values
+    :param template_images: a dictionary with physical object names as keys and the template images as values
+    :param scales: the scales of the template images to compute the features for
+    :return: a dictionary with physical object names as keys and dictionaries {scale: TemplateFeatures} as values
+    """
+    result = {}
+    os.makedirs(features_path, exist_ok=True)
+    for name, template_image_file in template_image_files.items():
+        template_image = template_images.get(name)
+        if template_image is None:
+            continue
+
+        try:
+            template_hash = get_template_hash(template_image_file, scales, akaze_threshold)
+            features_file_name = os.path.splitext(os.path.basename(template_image_file))[0] + FEATURES_FILE_EXTENSION
+            features_file_path = os.path.join(features_path, features_file_name)
+            features = _read_features(features_file_path, template_hash, scales)
+            if features is None:
+                features = {scale: compute_template_features(template_image, scale, akaze_threshold)
+                            for scale in scales}
+                _write_features(features_file_path, template_hash, features)
+                logger.info("Computed the template features of {}".format(name))
+
+            result[name] = features
+        except Exception as exp:
+            logger.error("Could not load the template features of {}".format(name))
+            logger.error(exp)
+            traceback.print_tb(exp.__traceback__)
+
+    return result
+
+
+def _read_features(features_file_path, template_hash, scales):
+    if not os.path.isfile(features_file_path):
+        return None
+
+    with np.load(features_file_path) as data:
+        if str(data["hash"]) != template_hash:
+            return None
+
+        return {scale: TemplateFeatures(data["key_points_{}".format(i)], data["descriptors_{}".format(i)])
+                for i, scale in enumerate(scales)}
+
+
+def _write_features(features_file_path, template_hash, features):
+    arrays = {"hash": np.array(template_hash)}
+    for i, template_features in enumerate(features.values()):
+        arrays["key_points_{}".format(i)] = template_features.key_points_array
+        descriptors = template_features.descriptors
+        arrays["descriptors_{}".format(i)] = descriptors if descriptors is not None else np.zeros((0, 61), np.uint8)
+    np.savez(features_file_path, **arrays)
@@ -0,0 +1,182 @@
+import logging
+import math
+import time
+
+import cv2
+import numpy as np
+
+import isar
+
+logger = logging.getLogger("isar.tiling")
+
+
+"""
+Small objects get lost when a full HD camera image is scaled down to the input size of the YOLO network.
+The TiledPredictor covers the image with overlapping tiles, runs the tiles as one batch through the network,
+and merges the predictions of the tiles with a non-maximum suppression across the tiles.
+Tiles that have not changed since they were last detected are not run again, their last predictions are reused.
+The cache of the tiles is for the whole scene. The changed regions that the motion gating crops from the scene
+are tiled without the cache, because their tiles do not match the tiles of the scene.
+
+The TiledPredictor has the same return_predict() as darkflow TFNet and OpenCVYolo, so the object detectors
+can use it in place of them.
+"""
+
+
+def compute_tiles(image_size, tile_size, overlap=0.25):
+    """
+    :param image_size: (width, height) of the image
+    :param tile_size: (width, height) of a tile
+    :param overlap: min overlap of two neighbouring tiles relative to the tile size
+    :return: list of tiles (x, y, width, height) that cover the image
+    """
+    xs = _compute_tile_positions(image_size[0], tile_size[0], overlap)
+    ys = _compute_tile_positions(image_size[1], tile_size[1], overlap)
+    tile_width, tile_height = min(tile_size[0], image_size[0]), min(tile_size[1], image_size[1])
+    return [(x, y, tile_width, tile_height) for y in ys for x in xs]
+
+
+def _compute_tile_positions(length, tile_length, overlap):
+    if length <= tile_length:
+        return [0]
+
+    stride = tile_length * (1 - overlap)
+    num_tiles = math.ceil((length - tile_length) / stride) + 1
+    return [int(round(v)) for v in np.linspace(0, length - tile_length, num_tiles)]
+
+
+def non_max_suppression(prediction_results, overlap_threshold=0.6):
+    """
+    Remove the predictions that overlap a prediction of the same label with higher confidence.
+    The overlap is the intersection relative to the smaller box, because an object cut by the border of a tile
+    has a small box that is inside the box of the same object in the neighbouring tile.
+    :param prediction_results: list of predictions dictionaries (label, confidence, topleft, bottomright)
+    """
+    result = []
+    for prediction_result in sorted(prediction_results, key=lambda p: p["confidence"], reverse=True):
+        if not any(kept["label"] == prediction_result["label"] and
+                   _get_overlap(kept, prediction_result) > overlap_threshold for kept in result):
+            result.append(prediction_result)
+    return result
+
+
+def _get_overlap(prediction_result1, prediction_result2):
+    x0 = max(prediction_result1["topleft"]["x"], prediction_result2["topleft"]["x"])
+    y0 = max(prediction_result1["topleft"]["y"], prediction_result2["topleft"]["y"])
+    x1 = min(prediction_result1["bottomright"]["x"], prediction_result2["bottomright"]["x"])
+    y1 = min(prediction_result1["bottomright"]["y"], prediction_result2["bottomright"]["y"])
+    intersection = max(0, x1 - x0) * max(0, y1 - y0)
+    min_area = min(_get_area(prediction_result1), _get_area(prediction_result2))
+    return intersection / min_area if min_area > 0 else 0
+
+
+def _get_area(prediction_result):
+    return (prediction_result["bottomright"]["x"] - prediction_result["topleft"]["x"]) * \
+           (prediction_result["bottomright"]["y"] - prediction_result["topleft"]["y"])
+
+
+class TiledPredictor:
+    def __init__(self, predictor, tile_size=(832, 832), overlap=0.25, diff_threshold=25, min_changed_pixels=4,
+                 refresh_interval=isar.OBJECT_DETECTION_REFRESH_INTERVAL):
+        """
+        :param predictor: the object detector network (darkflow TFNet or OpenCVYolo)
+        :param diff_threshold: min gray value difference of a changed pixel of the tile thumbnails
+        :param min_changed_pixels: min number of changed thumbnail pixels for the tile to be detected again
+        :param refresh_interval: max time in sec a tile is not detected
+        """
+        self.predictor = predictor
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.diff_threshold = diff_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.refresh_interval = refresh_interval
+
+        # the last detected image size and for each of its tiles: (thumbnail, detection time, predictions)
+        self._image_size = None
+        self._tiles_cache = {}
+
+    def return_predict(self, image, use_cache=True):
+        """
+        :param use_cache: False for an image that is not the whole scene (e.g. a changed region of it),
+        all its tiles are detected and the cache of the scene tiles is kept.
+        :return: the merged predictions of the tiles in image coordinates
+        """
+        image_size = (image.shape[1], image.shape[0])
+        if not use_cache:
+            return self._predict_uncached(image, compute_tiles(image_size, self.tile_size, self.overlap))
+
+        if image_size != self._image_size:
+            self._image_size = image_size
+            self._tiles_cache = {}
+
+        tiles = compute_tiles(image_size, self.tile_size, self.overlap)
+        changed_tiles = []
+        thumbnails = {}
+        for tile in tiles:
+            thumbnails[tile] = self._get_thumbnail(image, tile)
+            if self._is_changed(tile, thumbnails[tile]):
+                changed_tiles.append(tile)
+
+        if len(changed_tiles) > 0:
+            tiles_prediction_results = self._predict_tiles(image, changed_tiles)
+            detection_time = time.time()
+            for tile, prediction_results in zip(changed_tiles, tiles_prediction_results):
+                self._tiles_cache[tile] = (thumbnails[tile], detection_time, prediction_results)
+
+        logger.debug("Detected {} of {} tiles.".format(len(changed_tiles), len(tiles)))
+        prediction_results = []
+        for tile in tiles:
+            prediction_results.extend(self._tiles_cache[tile][2])
+        return non_max_suppression(prediction_results)
+
+    def return_predict_batch(self, images):
+        return [self.return_predict(image) for image in images]
+
+    def _predict_uncached(self, image, tiles):
+        prediction_results = []
+        for tile_prediction_results in self._predict_tiles(image, tiles):
+            prediction_results.extend(tile_prediction_results)
+        return non_max_suppression(prediction_results)
+
+    def _predict_tiles(self, image, tiles):
+        """
+        :return: the predictions of each tile in image coordinates
+        """
+        tile_images = [image[y:y + height, x:x + width] for x, y, width, height in tiles]
+        if hasattr(self.predictor, "return_predict_batch"):
+            tiles_prediction_results = self.predictor.return_predict_batch(tile_images)
+        else:
+            tiles_prediction_results = [self.predictor.return_predict(tile_image) for tile_image in tile_images]
+
+        return [[self._to_image_coordinates(p, tile) for p in prediction_results]
+                for tile, prediction_results in zip(tiles, tiles_prediction_results)]
+
+    def _is_changed(self, tile, thumbnail):
+        if tile not in self._tiles_cache:
+            return True
+
+        last_thumbnail, detection_time, _ = self._tiles_cache[tile]
+        if time.time() - detection_time > self.refresh_interval:
+            return True
+
+        return np.count_nonzero(cv2.absdiff(thumbnail, last_thumbnail) > self.diff_threshold) >= \
+            self.min_changed_pixels
+
+    @staticmethod
+    def _get_thumbnail(image, tile):
+        x, y, width, height = tile
+        tile_image = image[y:y + height, x:x + width]
+        thumbnail = cv2.resize(tile_image, (max(1, width // 8), max(1, height // 8)), interpolation=cv2.INTER_AREA)
+        if len(thumbnail.shape) == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail
+
+    @staticmethod
+    def _to_image_coordinates(prediction_result, tile):
+        x, y = tile[0], tile[1]
+        prediction_result = dict(prediction_result)
+        prediction_result["topleft"] = {"x": prediction_result["topleft"]["x"] + x,
+                                        "y": prediction_result["topleft"]["y"] + y}
+        prediction_result["bottomright"] = {"x": prediction_result["bottomright"]["x"] + x,
+                                            "y": prediction_result["bottomright"]["y"] + y}
+        return prediction_result
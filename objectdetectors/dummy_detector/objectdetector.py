@@ -37,7 +37,10 @@ def get_predictions(obj_detection_request):
     predictions = []
     tl = (x, y)
     br = (x + width, y + height)
-    prediction = ObjectDetectionPrediction("Rubber Duck", 0.8, tl, br)
+    offset_x, offset_y = frame.offset
+    prediction = ObjectDetectionPrediction("Rubber Duck", 0.8,
+                                           (tl[0] + offset_x, tl[1] + offset_y),
+                                           (br[0] + offset_x, br[1] + offset_y))
     prediction.image = frame.raw_image[tl[1]:br[1], tl[0]:br[0]].copy()
     cv2.imwrite(str(os.path.join(temp_folder_path, "dummy_prediciton_image.jpg")), prediction.image)
     predictions.append(prediction)
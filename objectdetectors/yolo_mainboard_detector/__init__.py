@@ -3,7 +3,7 @@ import logging
 import os
 import cv2
 
-from isar.scene.physicalobjectmodel import PhysicalObject
+from isar.tracking.templatefeatures import load_template_features
 
 
 logger = logging.getLogger("isar.objectdetectors.yolo_mainboard_detector")
@@ -12,31 +12,47 @@ object_detector_package_path = os.path.dirname(__file__)
 template_images_path = os.path.join(object_detector_package_path, "template_images/")
 physical_objects_json_path = os.path.join(object_detector_package_path, "physical_objects.json")
 temp_folder_path = os.path.join(object_detector_package_path, "tmp/")
+template_features_path = os.path.join(object_detector_package_path, "template_features/")
 
 physical_objects = []
 physical_objects_dict = {}
 
+# The template images and their AKAZE features (see templatefeatures.py) for each physical object name.
+# They are loaded without isar.scene, so that the pose estimator processes can import this package on their own.
+template_images = {}
+template_features = {}
 
-def init_physical_objects():
+
+def load_template_images():
     with open(physical_objects_json_path) as f:
         po_dicts = json.load(f)
 
+    template_image_files = {}
     for po_dict in po_dicts:
-        po = PhysicalObject()
-        po.__dict__.update(po_dict)
-        po.template_image = cv2.imread(str(template_images_path) + po.image_path)
-        physical_objects.append(po)
-        physical_objects_dict[po.name] = po
-
-
-init_physical_objects()
-
-
-
+        template_image_files[po_dict["name"]] = str(template_images_path) + po_dict["image_path"]
+        template_images[po_dict["name"]] = cv2.imread(template_image_files[po_dict["name"]])
+    return template_image_files
 
 
+def init_physical_objects():
+    """
+    Create the physical objects of the detector. It is called by the object detector module, isar.scene can not
+    be imported in the pose estimator processes.
+    """
+    from isar.scene.physicalobjectmodel import PhysicalObject
 
+    if len(physical_objects) > 0:
+        return
 
+    with open(physical_objects_json_path) as f:
+        po_dicts = json.load(f)
 
+    for po_dict in po_dicts:
+        po = PhysicalObject()
+        po.__dict__.update(po_dict)
+        po.template_image = template_images.get(po.name)
+        physical_objects.append(po)
+        physical_objects_dict[po.name] = po
 
 
+template_features.update(load_template_features(load_template_images(), template_images, template_features_path))
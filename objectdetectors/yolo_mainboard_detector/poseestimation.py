@@ -1,9 +1,7 @@
 import itertools
 import logging
-import multiprocessing as mp
 import os
 import random
-import sys
 import traceback
 
 import cv2
@@ -11,8 +9,7 @@ import numpy as np
 import time
 
 import isar
-from isar.tracking.objectdetection import POISON_PILL
-from objectdetectors.yolo_mainboard_detector import temp_folder_path
+from objectdetectors.yolo_mainboard_detector import temp_folder_path, template_images, template_features
 
 logger = logging.getLogger('isar.yolo_maiboard_detector.pose_estimator')
 debug = True
@@ -23,7 +20,7 @@ MIN_IMAGE_DIMENSION = 150  # px
 SCALE_FACTOR = 2
 
 
-class PoseEstimator(mp.Process):
+class PoseEstimator:
     MAX_FEATURES = 500
     GOOD_MATCH_PERCENT = 0.90
     ransac_reprojection_threshold = 5
@@ -42,37 +39,48 @@ class PoseEstimator(mp.Process):
     # recompute_homography_using_ECC_threshold_max = 90
     recompute_homography_using_ECC_threshold_max = 80
 
-    def __init__(self, task_queue, result_queue):
-        mp.Process.__init__(self)
-        self.task_queue = task_queue
-        self.result_queue = result_queue
-
-    def run(self):
-        while True:
-            pe_input = self.task_queue.get()
-
-            if pe_input == POISON_PILL:
-                logger.info("Received None pose_estimation_input. Shutting down.")
-                self.task_queue.task_done()
-                sys.exit(0)
-
-            # compute pose from template and target images
-            # put a PoseEstimationOutput instance int the results queue
-            t1 = time.time()
-            try:
-                estimated_pose = self.find_best_homography(pe_input.template_image, pe_input.target_image, pe_input.best_homography)
-            except:
-                estimated_pose = PoseEstimationOutput(None, DEFAULT_HOMOGRAPHY, 1.)
-
-            estimated_pose.object_name = pe_input.object_name
-            self.task_queue.task_done()
-            self.result_queue.put(estimated_pose)
-            logger.debug("Finding best homograpy for {} took {}".format(pe_input.object_name, time.time() - t1))
-
-        return
-
-    def find_best_homography(self, physical_object_image, cropped_image, best_pe):
-        pe_result = self.compute_homography(physical_object_image, cropped_image)
+    # update the previous homography with ECC on the downscaled images first,
+    # the features are matched only if the error of the updated homography is above the threshold
+    temporal_tracking = True
+    temporal_tracking_scale = 0.25
+    temporal_tracking_min_image_dimension = 32  # px of the downscaled images
+    temporal_tracking_iterations = 50
+    temporal_tracking_error_threshold = 40
+
+    def __init__(self):
+        # the feature extractors and matchers are created once per pose estimator process for each algorithm
+        self._feature_extractors = {}
+        self._matchers = {}
+
+    def estimate_pose(self, pe_input):
+        """
+        Compute the pose of the object in pe_input.target_image from its template image and target image.
+        :return: a PoseEstimationOutput
+        """
+        t1 = time.time()
+        try:
+            estimated_pose = self.find_best_homography(template_images[pe_input.object_name], pe_input.target_image,
+                                                       pe_input.best_homography,
+                                                       template_features.get(pe_input.object_name))
+        except:
+            estimated_pose = PoseEstimationOutput(None, DEFAULT_HOMOGRAPHY, 1.)
+
+        estimated_pose.object_name = pe_input.object_name
+        logger.debug("Finding best homograpy for {} took {}".format(pe_input.object_name, time.time() - t1))
+        return estimated_pose
+
+    def find_best_homography(self, physical_object_image, cropped_image, best_pe, physical_object_features=None):
+        """
+        :param physical_object_features: the precomputed features of physical_object_image for each scale,
+        if None the features are extracted from physical_object_image
+        """
+        if self.temporal_tracking and best_pe is not None:
+            tracked_pe = self.track_homography(physical_object_image, cropped_image, best_pe)
+            if tracked_pe is not None and tracked_pe.error < self.temporal_tracking_error_threshold:
+                logger.debug("Tracked homography, error: {}".format(tracked_pe.error))
+                return tracked_pe
+
+        pe_result = self.compute_homography(physical_object_image, cropped_image, physical_object_features)
         pe_result.error = self.compute_error(pe_result.homography, physical_object_image, cropped_image)
         # Keep track of the best pe_result. If the newly computed one is better, replace the best with it.
         # See compute_quality_score(). I think a better approach would be compute the quality of a pe_result using reprojection error.
@@ -117,8 +125,40 @@ class PoseEstimator(mp.Process):
         else:
             return best_pe
 
-    def compute_homography(self, physical_object_image, cropped_image):
+    def track_homography(self, physical_object_image, cropped_image, best_pe):
+        """
+        Update the previous homography with ECC on the downscaled images.
+        :return: a PoseEstimationOutput with the updated homography and its error, None if ECC failed
+        """
+        min_dimension = min(physical_object_image.shape[:2] + cropped_image.shape[:2])
+        scale = min(1., max(self.temporal_tracking_scale, self.temporal_tracking_min_image_dimension / min_dimension))
+        physical_object_image_gray, cropped_image_gray = self.convert_to_gray_scale(
+            cv2.resize(physical_object_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA),
+            cv2.resize(cropped_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+
+        # the translation of the affine homography scales with the images
+        scaled_homography = best_pe.homography.astype(np.float32)
+        scaled_homography[:, 2] *= scale
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, self.temporal_tracking_iterations, 1e-4)
+        try:
+            if isar.PLATFORM == "Darwin":
+                (_, h_tracked) = cv2.findTransformECC(physical_object_image_gray, cropped_image_gray,
+                                                      scaled_homography, cv2.MOTION_AFFINE, criteria)
+            else:
+                (_, h_tracked) = cv2.findTransformECC(physical_object_image_gray, cropped_image_gray,
+                                                      scaled_homography, cv2.MOTION_AFFINE, criteria,
+                                                      inputMask=None, gaussFiltSize=1)
+        except cv2.error as exp:
+            logger.debug("Could not track the homography: {}".format(exp))
+            return None
+
+        h_tracked[:, 2] /= scale
+        error = self.compute_error(h_tracked, physical_object_image, cropped_image, "_tracked")
+        return PoseEstimationOutput(None, h_tracked, error)
+
+    def compute_homography(self, physical_object_image, cropped_image, physical_object_features=None):
         # physicalObjectImage, croppedImage = convertToGrayScale(physicalObjectImage, croppedImage)
+        template_height = physical_object_image.shape[0]
         physical_object_image, cropped_image = self.checkAndScaleImages(physical_object_image, cropped_image)
 
         # physicalObjectKeyPoints, physicalObjectDescriptors, croppedImageKeyPoints, croppedImageDescriptors \
@@ -127,8 +167,17 @@ class PoseEstimator(mp.Process):
         #     = self.extract_feature_points(physical_object_image, cropped_image, algorithm='SIFT')
         # physicalObjectKeyPoints, physicalObjectDescriptors, croppedImageKeyPoints, croppedImageDescriptors \
         #     = self.extract_feature_points(physical_object_image, cropped_image, algorithm='ORB')
-        physicalObjectKeyPoints, physicalObjectDescriptors, croppedImageKeyPoints, croppedImageDescriptors \
-            = self.extract_feature_points(physical_object_image, cropped_image, algorithm='AKAZE')
+        template_features = None
+        if physical_object_features is not None:
+            template_features = physical_object_features.get(physical_object_image.shape[0] / template_height)
+
+        if template_features is not None:
+            # only the cropped image needs to be extracted, the template features are precomputed
+            physicalObjectKeyPoints, physicalObjectDescriptors = template_features.key_points, template_features.descriptors
+            croppedImageKeyPoints, croppedImageDescriptors = self.extract_image_feature_points(cropped_image, algorithm='AKAZE')
+        else:
+            physicalObjectKeyPoints, physicalObjectDescriptors, croppedImageKeyPoints, croppedImageDescriptors \
+                = self.extract_feature_points(physical_object_image, cropped_image, algorithm='AKAZE')
 
         # matches = self.find_matches(physicalObjectDescriptors, croppedImageDescriptors, algorithm='BRUTE_FORCE_L1')
         matches = self.find_matches(physicalObjectDescriptors, croppedImageDescriptors, algorithm='BRUTE_FORCE_HAMMING', ratio_test=False)
@@ -140,7 +189,10 @@ class PoseEstimator(mp.Process):
             imMatches = cv2.drawMatches(physical_object_image, physicalObjectKeyPoints, cropped_image, croppedImageKeyPoints, matches, None)
             cv2.imwrite(str(os.path.join(temp_folder_path, "matches.jpg")), imMatches)
 
-        points1, points2 = self.find_points_from_matches(physicalObjectKeyPoints, croppedImageKeyPoints, matches)
+        # the points of the template are taken from the precomputed key points array when it is available
+        physical_object_points = None if template_features is None else template_features.key_points_array[:, :2]
+        points1, points2 = self.find_points_from_matches(physicalObjectKeyPoints, croppedImageKeyPoints, matches,
+                                                         physical_object_points)
 
         # h1, mask = cv2.findHomography(points1, points2, cv2.RANSAC, ransac_reprojection_threshold)
         try:
@@ -193,6 +245,18 @@ class PoseEstimator(mp.Process):
         return tuple(result)
 
     def extract_feature_points(self, physical_object_image, cropped_image, algorithm='SURF'):
+        physical_object_key_points, physical_object_descriptors = self.extract_image_feature_points(physical_object_image, algorithm)
+        cropped_image_key_points, cropped_image_descriptors = self.extract_image_feature_points(cropped_image, algorithm)
+
+        return physical_object_key_points, physical_object_descriptors, cropped_image_key_points, cropped_image_descriptors
+
+    def extract_image_feature_points(self, image, algorithm='SURF'):
+        return self.get_feature_extractor(algorithm).detectAndCompute(image, None)
+
+    def get_feature_extractor(self, algorithm):
+        if algorithm in self._feature_extractors:
+            return self._feature_extractors[algorithm]
+
         feature_extractor = None
         if algorithm == 'SURF':
             feature_extractor = cv2.xfeatures2d.SURF_create()
@@ -203,24 +267,11 @@ class PoseEstimator(mp.Process):
         elif algorithm == 'AKAZE':
             feature_extractor = cv2.AKAZE_create(threshold=PoseEstimator.AKAZE_THRESHOLD)
 
-        physical_object_key_points, physical_object_descriptors = feature_extractor.detectAndCompute(physical_object_image, None)
-        cropped_image_key_points, cropped_image_descriptors = feature_extractor.detectAndCompute(cropped_image, None)
-
-        return physical_object_key_points, physical_object_descriptors, cropped_image_key_points, cropped_image_descriptors
+        self._feature_extractors[algorithm] = feature_extractor
+        return feature_extractor
 
     def find_matches(self, physical_object_descriptors, cropped_image_descriptors, algorithm=None, ratio_test=False):
-        matcher = None
-        if algorithm == 'FLANN':
-            FLANN_INDEX_KDTREE = 0
-            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
-            search_params = dict(checks=50)
-            matcher = cv2.FlannBasedMatcher(index_params, search_params)
-        elif algorithm == 'BRUTE_FORCE_HAMMING':
-            matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-            # matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-        elif algorithm == 'BRUTE_FORCE_L1':
-            matcher = cv2.DescriptorMatcher_create(cv2.DESCRIPTOR_MATCHER_BRUTEFORCE_L1)
-
+        matcher = self.get_matcher(algorithm)
         good_matches = []
         if ratio_test:
             # matches = matcher.knnMatch(physical_object_descriptors, cropped_image_descriptors, k=2)
@@ -231,23 +282,52 @@ class PoseEstimator(mp.Process):
                         if m[0].distance < 0.5 * n[0].distance:
                             good_matches.append(m[0])
         else:
-            matches = matcher.match(physical_object_descriptors, cropped_image_descriptors)
-            matches.sort(key=lambda x: x.distance, reverse=False)
+            matches = sorted(matcher.match(physical_object_descriptors, cropped_image_descriptors),
+                             key=lambda x: x.distance)
             num_good_matches = int(len(matches) * self.GOOD_MATCH_PERCENT)
             good_matches = matches[:num_good_matches]
 
         logger.debug("Number of good matches: %s", len(good_matches))
         return good_matches
 
+    def get_matcher(self, algorithm):
+        if algorithm in self._matchers:
+            return self._matchers[algorithm]
+
+        matcher = None
+        if algorithm == 'FLANN':
+            FLANN_INDEX_KDTREE = 0
+            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=5)
+            search_params = dict(checks=50)
+            matcher = cv2.FlannBasedMatcher(index_params, search_params)
+        elif algorithm == 'BRUTE_FORCE_HAMMING':
+            matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+            # matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+        elif algorithm == 'BRUTE_FORCE_L1':
+            matcher = cv2.DescriptorMatcher_create(cv2.DESCRIPTOR_MATCHER_BRUTEFORCE_L1)
+
+        self._matchers[algorithm] = matcher
+        return matcher
+
     @staticmethod
-    def find_points_from_matches(physical_object_key_points, cropped_image_key_points, matches):
+    def find_points_from_matches(physical_object_key_points, cropped_image_key_points, matches,
+                                 physical_object_points=None):
+        """
+        :param physical_object_points: the (x, y) coordinates of physical_object_key_points as an array, if available
+        :return: the matched points of the physical object and of the cropped image
+        """
         # Extract location of good matches
-        points1 = np.zeros((len(matches), 2), dtype=np.float32)
-        points2 = np.zeros((len(matches), 2), dtype=np.float32)
+        if len(matches) == 0:
+            return np.zeros((0, 2), dtype=np.float32), np.zeros((0, 2), dtype=np.float32)
 
-        for i, match in enumerate(matches):
-            points1[i, :] = physical_object_key_points[match.queryIdx].pt
-            points2[i, :] = cropped_image_key_points[match.trainIdx].pt
+        indices = np.array([(match.queryIdx, match.trainIdx) for match in matches], dtype=np.int32)
+        query_indices, train_indices = indices[:, 0], indices[:, 1]
+        if physical_object_points is not None:
+            points1 = physical_object_points[query_indices].astype(np.float32, copy=False)
+        else:
+            points1 = cv2.KeyPoint_convert(physical_object_key_points, query_indices)
+        # only the matched key points of the cropped image are converted
+        points2 = cv2.KeyPoint_convert(cropped_image_key_points, train_indices)
 
         return points1, points2
 
@@ -312,9 +392,12 @@ class PoseEstimationOutput:
 
 
 class PoseEstimationInput:
-    def __init__(self, object_name, template_image, target_image, best_homography):
+    """
+    The template image and its features are not sent with the input,
+    the pose estimator processes have them for each physical object name.
+    """
+    def __init__(self, object_name, target_image, best_homography):
         self.object_name = object_name
-        self.template_image = template_image
         self.target_image = target_image
         self.best_homography = best_homography
 
@@ -4,18 +4,22 @@ import os
 import time
 import traceback
 
+import numpy as np
+
 import isar
 from isar.camera.camera import CameraFrame
-from isar.tracking.objectdetection import ObjectDetectionPrediction, POISON_PILL
+from isar.tracking.objectdetection import ObjectDetectionPrediction, get_prediction_center, is_in_region
+from isar.tracking.opencvyolo import OpenCVYolo
+from isar.tracking.tiling import TiledPredictor
 from objectdetectors.yolo_tool_detector import physical_objects, object_detector_package_path, temp_folder_path, \
-    physical_objects_dict
-
-import multiprocessing as mp
+    physical_objects_dict, init_physical_objects
 
 from objectdetectors.yolo_tool_detector.poseestimation import PoseEstimator, PoseEstimationInput
 
 logger = logging.getLogger("isar.objectdetectors.yolo_simple_tool_detector.detector")
 
+init_physical_objects()
+
 name = "YOLO_SIMPLE_TOOL_DETECTOR"
 description = "Yolo simple tool detector"
 
@@ -23,13 +27,23 @@ activate = True
 
 debug = False
 
+# "darkflow": darkflow TFNet on the GPU, "opencv": CPU inference with the OpenCV DNN module
+yolo_backend = "darkflow"
+
+# detect small objects on overlapping tiles of the scene instead of on the whole scene scaled down
+tiling = False
+tile_size = (832, 832)
+
+# the poses are estimated by the pose estimation pool of the ObjectDetectionService
+pose_estimator_module = PoseEstimator.__module__
+
 tfnet = None
-pose_estimators = []
-num__pose_estimator_processes = 10
+# set by the object detector worker process to its client of the pose estimation pool
+pose_estimation_client = None
 
 best_homographies = {}
-pose_estimation_task_queue = mp.JoinableQueue()
-pose_estimation_results_queue = mp.Queue()
+# the centers of the last predictions of the objects in best_homographies, in camera coordinates
+best_homographies_centers = {}
 
 
 def get_predictions(obj_detection_request):
@@ -52,15 +66,12 @@ def get_predictions(obj_detection_request):
 
     predictions = []
     try:
-        if len(pose_estimators) == 0:
-            init_pose_estimators()
-
         # To make object detection faster we can resize the frame if needed.
         # However, we should calculate back the coordinates returned by object detector based on the scale factor.
 
         t1 = time.time()
-        predictions = run_object_detection(frame)
-        estimate_pose(predictions, obj_detection_request.scene_physical_objects_names)
+        predictions = run_object_detection(frame, obj_detection_request.region)
+        estimate_pose(predictions, obj_detection_request.scene_physical_objects_names, obj_detection_request.region)
 
     except Exception as e:
         logging.error(e)
@@ -70,18 +81,62 @@ def get_predictions(obj_detection_request):
     return predictions
 
 
-def estimate_pose(predictions, scene_phys_objs_names):
-    # Only estimate the pose for the scene_phys_objs.
+def warm_up():
+    """
+    Load the YOLO model and run a dummy inference,
+    so that the first request is not delayed.
+    """
+    if tfnet is None:
+        init_yolo()
+        logger.info("YOLO model loaded.")
 
-    present_objects_names = [prediction.label for prediction in predictions]
-    remove_from_best_homographies = list(set(best_homographies.keys()) - set(present_objects_names))
-    for name in remove_from_best_homographies:
-        del best_homographies[name]
+    tfnet.return_predict(np.zeros((416, 416, 3), np.uint8))
 
-    for key in best_homographies.keys():
-        if key not in scene_phys_objs_names:
-            del best_homographies[key]
 
+def get_predictions_batch(obj_detection_requests):
+    """
+    Run the object detection once for the camera frames of all the requests.
+    :return: the list of predictions for each request
+    """
+    if tfnet is None:
+        init_yolo()
+        logger.info("YOLO model loaded.")
+
+    predictions_batch = [[] for _ in obj_detection_requests]
+    t1 = time.time()
+    try:
+        predictions_batch = run_object_detection_batch([request.camera_frame for request in obj_detection_requests],
+                                                       [request.region for request in obj_detection_requests])
+        for request, predictions in zip(obj_detection_requests, predictions_batch):
+            estimate_pose(predictions, request.scene_physical_objects_names, request.region)
+
+    except Exception as e:
+        logging.error(e)
+        traceback.print_tb(e.__traceback__)
+
+    logger.debug("Object detections and computing homographies for {} frames took {}".format(
+        len(obj_detection_requests), time.time() - t1))
+    return predictions_batch
+
+
+def estimate_pose(predictions, scene_phys_objs_names, region=None):
+    """
+    Only estimate the pose for the scene_phys_objs.
+    :param region: the region (x, y, width, height) in camera coordinates the predictions were detected in,
+    None for the whole scene. The objects that were last seen outside of the region keep their homographies.
+    """
+    if pose_estimation_client is None:
+        return
+
+    present_objects_names = [prediction.label for prediction in predictions]
+    for name in list(best_homographies.keys()):
+        is_gone = name not in present_objects_names and \
+                  (name not in best_homographies_centers or is_in_region(best_homographies_centers[name], region))
+        if is_gone or name not in scene_phys_objs_names:
+            del best_homographies[name]
+            best_homographies_centers.pop(name, None)
+
+    futures = {}
     for target in predictions:
         if target.label not in scene_phys_objs_names:
             continue
@@ -92,37 +147,39 @@ def estimate_pose(predictions, scene_phys_objs_names):
                 best_homographies[template.name] is not None:
             best_homography = best_homographies[template.name]
 
-        pe_input = PoseEstimationInput(template.name, template.template_image, target.image, best_homography)
-        pose_estimation_task_queue.put(pe_input)
+        pe_input = PoseEstimationInput(template.name, target.image, best_homography)
+        futures[template.name] = pose_estimation_client.submit(pe_input)
 
-    pose_estimation_task_queue.join()
-    for i in range(len(physical_objects)):
-        if not pose_estimation_results_queue.empty():
-            pe_output = pose_estimation_results_queue.get()
-            best_homographies[pe_output.object_name] = pe_output
+    # the objects whose pose estimation misses the deadline keep their previous homography
+    pose_estimation_client.wait(futures.values())
+    for object_name, future in futures.items():
+        if future.result() is not None:
+            best_homographies[object_name] = future.result()
+
+    for prediction in predictions:
+        if prediction.label in best_homographies:
+            best_homographies_centers[prediction.label] = get_prediction_center(prediction)
 
     for prediction in predictions:
         if prediction.label in scene_phys_objs_names:
-            prediction.pose_estimation = best_homographies[prediction.label]
+            prediction.pose_estimation = best_homographies.get(prediction.label)
 
 
-def run_object_detection(frame: CameraFrame):
+def run_object_detection(frame: CameraFrame, region=None):
+    """
+    :param region: the changed region of the scene the frame is cropped to, None if the frame is the whole scene
+    """
     predictions = []
     try:
         if tfnet is None:
             init_yolo()
 
-        prediction_results = tfnet.return_predict(frame.raw_image)
-        for pred_result in prediction_results:
-            tl = (pred_result['topleft']['x'], pred_result['topleft']['y'])
-            br = (pred_result['bottomright']['x'], pred_result['bottomright']['y'])
-            label = pred_result['label']
-            confidence = pred_result['confidence']
-            prediction = ObjectDetectionPrediction(label, confidence, tl, br)
-            prediction.image = frame.raw_image[tl[1]:br[1], tl[0]:br[0]].copy()
-            if debug: cv2.imwrite(str(os.path.join(temp_folder_path, label + "_prediciton.jpg")), prediction.image)
-            # prediction.pose_estimation will be set in the get_predictions
-            predictions.append(prediction)
+        if isinstance(tfnet, TiledPredictor):
+            # the tiles of a region do not match the cached tiles of the whole scene
+            prediction_results = tfnet.return_predict(frame.raw_image, use_cache=region is None)
+        else:
+            prediction_results = tfnet.return_predict(frame.raw_image)
+        predictions = convert_prediction_results(frame, prediction_results)
     except Exception as e:
         logging.error(e)
         traceback.print_tb(e.__traceback__)
@@ -130,6 +187,42 @@ def run_object_detection(frame: CameraFrame):
     return predictions
 
 
+def run_object_detection_batch(frames, regions):
+    if tfnet is None:
+        init_yolo()
+
+    if isinstance(tfnet, TiledPredictor):
+        prediction_results_batch = [tfnet.return_predict(frame.raw_image, use_cache=region is None)
+                                    for frame, region in zip(frames, regions)]
+    elif hasattr(tfnet, "return_predict_batch"):
+        prediction_results_batch = tfnet.return_predict_batch([frame.raw_image for frame in frames])
+    else:
+        prediction_results_batch = [tfnet.return_predict(frame.raw_image) for frame in frames]
+
+    return [convert_prediction_results(frame, prediction_results)
+            for frame, prediction_results in zip(frames, prediction_results_batch)]
+
+
+def convert_prediction_results(frame, prediction_results):
+    # The image of the frame can be only the scene area of the camera image.
+    # frame.offset is its position in camera coordinates.
+    predictions = []
+    offset_x, offset_y = frame.offset
+    for pred_result in prediction_results:
+        tl = (pred_result['topleft']['x'], pred_result['topleft']['y'])
+        br = (pred_result['bottomright']['x'], pred_result['bottomright']['y'])
+        label = pred_result['label']
+        confidence = pred_result['confidence']
+        prediction = ObjectDetectionPrediction(label, confidence,
+                                               (tl[0] + offset_x, tl[1] + offset_y),
+                                               (br[0] + offset_x, br[1] + offset_y))
+        prediction.image = frame.raw_image[tl[1]:br[1], tl[0]:br[0]].copy()
+        if debug: cv2.imwrite(str(os.path.join(temp_folder_path, label + "_prediciton.jpg")), prediction.image)
+        # prediction.pose_estimation will be set in the get_predictions
+        predictions.append(prediction)
+    return predictions
+
+
 def init_yolo():
     global tfnet
     yolo_model_path = os.path.join(object_detector_package_path, "model/")
@@ -140,26 +233,20 @@ def init_yolo():
         "threshold": 0.5,
         "gpu": 1.0
     }
-    from darkflow.net.build import TFNet
-    tfnet = TFNet(yolo_options)
-
+    if yolo_backend == "opencv":
+        # same predictions format as TFNet.return_predict()
+        tfnet = OpenCVYolo(yolo_options["model"], yolo_options["load"], yolo_options["labels"],
+                           threshold=yolo_options["threshold"])
+    else:
+        from darkflow.net.build import TFNet
+        tfnet = TFNet(yolo_options)
 
-def init_pose_estimators():
-    global pose_estimators
-    pose_estimators = [PoseEstimator(pose_estimation_task_queue, pose_estimation_results_queue)
-                       for i in range(num__pose_estimator_processes)]
-    for p in pose_estimators:
-        p.daemon = True
-        p.start()
-
-    logger.info("All pose estimator processes started.")
+    if tiling:
+        tfnet = TiledPredictor(tfnet, tile_size=tile_size)
 
 
 def terminate():
-    for i in range(num__pose_estimator_processes):
-        pose_estimation_task_queue.put(POISON_PILL)
-        pose_estimation_task_queue.cancel_join_thread()
-        pose_estimation_results_queue.cancel_join_thread()
+    pass
 
 
 def get_physical_objects():